@@ -0,0 +1,471 @@
+''' Weekly & summary aggregation kernels for the batch process.
+
+    Each kernel works on a single hierarchy level (Area type) partition so the batch can run the levels in
+    a process pool.  Partitions are handed to the pool workers as Arrow IPC streams in shared memory blocks
+    rather than pickled dataframes, and results are merged back in a fixed order so output is deterministic. '''
+
+import pandas as pd
+import numpy as np
+import datetime
+import time
+import multiprocessing
+import resource
+import sys
+from multiprocessing import shared_memory
+import pyarrow as pa
+
+AREA_KEYS = ['Area code','Area name','Area type']
+TREND_WINDOW_DAYS = 31     # Days of daily data needed for trend slope & last 7 day stats
+
+
+def calc_weekly_cases(dailydf):
+    ''' Returns weekly case totals for the given daily cases (includes last incomplete week) '''
+
+    tempdf = dailydf.loc[(dailydf.index > '2020-02-29')]
+    wdf = tempdf.groupby(AREA_KEYS)['Cases'].resample('w').sum().reset_index()
+
+    wdf['Week'] = wdf['Date'].dt.strftime('%Y%U').astype("int")
+    wdf['Cases'] = wdf['Cases'].astype(int)
+
+    return wdf
+
+
+def merge_weekly_cases(frames):
+    ''' Combines weekly level partitions into one dataframe and drops the last (incomplete) week '''
+
+    wdf = pd.concat(frames, ignore_index=True)
+    wdf = wdf.sort_values(by=AREA_KEYS+['Date'], kind='mergesort', ignore_index=True)
+
+    # Drop last incomplete week
+    return wdf.loc[(wdf['Week'] < wdf['Week'].max())]
+
+
+def calc_level_stats(dailydf, weeklydf, week_max, last30):
+    ''' Returns case stats (totals, peaks, recent weeks, trend slope) by area for a level partition.
+        week_max and last30 are passed in so every partition uses the same reporting periods '''
+
+    statsdf = dailydf.groupby(AREA_KEYS).agg({'Cases' : ['sum','mean','max']})
+    statsdf.columns = ['All Time Cases', 'Average Daily Cases', 'Peak Daily Cases']
+
+    return statsdf.join(calc_weekly_stats(weeklydf, week_max)).join(calc_trend_stats(dailydf, last30))
+
+
+def calc_daily_totals(dailydf):
+    ''' Returns sum, count and max of daily cases by area.  Published alongside the summary so later loads can add
+        new days to them rather than aggregate full history again '''
+
+    return dailydf.groupby(AREA_KEYS)['Cases'].agg(['sum','count','max'])
+
+
+def merge_daily_totals(frames):
+    ''' Combines daily totals for separate days (or areas) into one dataframe '''
+
+    return pd.concat(frames).groupby(level=AREA_KEYS).agg({'sum':'sum','count':'sum','max':'max'})
+
+
+def calc_totals_stats(totalsdf, weeklydf, week_max, dailydf, last30):
+    ''' Returns case stats by area as calc_level_stats, but from daily totals - dailydf only needs the days since last30 '''
+
+    statsdf = pd.DataFrame({
+        'All Time Cases' : totalsdf['sum'],
+        'Average Daily Cases' : totalsdf['sum'] / totalsdf['count'],
+        'Peak Daily Cases' : totalsdf['max']
+    })
+
+    return statsdf.join(calc_weekly_stats(weeklydf, week_max)).join(calc_trend_stats(dailydf, last30))
+
+
+def calc_weekly_stats(weeklydf, week_max):
+    ''' Returns totals for last 4 weeks, last 2 weeks and preceding 2 weeks by area '''
+
+    wdflast4 = weeklydf.loc[(weeklydf['Week'] > week_max - 4)]
+    wdflast2 = weeklydf.loc[(weeklydf['Week'] > week_max - 2)]
+    wdfprev2 = weeklydf.loc[((weeklydf['Week'] > week_max - 4) & (weeklydf['Week'] <= week_max - 2))]
+
+    statsdf = wdflast4.groupby(AREA_KEYS).agg(**{'Last 4 Weeks Cases' : ('Cases','sum')})
+    statsdf = statsdf.join(wdflast2.groupby(AREA_KEYS).agg(**{'Cases in Last Fortnight' : ('Cases','sum')}))
+    return statsdf.join(wdfprev2.groupby(AREA_KEYS).agg(**{'Cases in Previous Fortnight' : ('Cases','sum')}))
+
+
+def calc_trend_stats(dailydf, last30):
+    ''' Returns 14 day trend slope and last 7 day totals by area from daily cases since last30 '''
+
+    # Daily dataset for last 30 days, pivoted so we have a dataframe with dates as columns.  Every partition (level,
+    # changed areas, streamed window) gets the same date columns - the whole window to the latest date of all the
+    # data, with days an area has no cases for as 0 - so the last 7 days & slope windows line up across levels
+    sdf = dailydf.loc[dailydf.index >= last30].reset_index()
+    spivot = sdf.pivot_table(index=AREA_KEYS,columns='Date',values='Cases',aggfunc=np.sum)
+    spivot = spivot.reindex(columns=pd.date_range(last30, periods=TREND_WINDOW_DAYS + 1), fill_value=0)
+    unpivot = pd.DataFrame(spivot.to_records())
+    unpivot.set_index(AREA_KEYS,inplace=True)
+
+    # Calculate slope & last 7 day totals (vectorised over all areas)
+    cases = unpivot.fillna(0).values
+    unpivot['Last 14 Days Trend Slope'] = calc_slopes(cases)
+    unpivot['Cases in Last 7 Days'] = cases[:, -7:].sum(axis=1).astype(int)
+
+    return unpivot[['Last 14 Days Trend Slope','Cases in Last 7 Days']]
+
+
+def calc_summary_cases(populationdf, statsdf):
+    ''' Returns summary dataframe (population, ratios etc) for the given population and merged area stats '''
+
+    summarydf = populationdf.join(statsdf)
+
+    # Calculate ratios
+    summarydf['All Time Cases Per 1000 People'] = round(summarydf['All Time Cases']  / summarydf['Population'] * 1000,2)
+    summarydf['Last 4 Weeks Cases Per 1000 People'] = round(summarydf['Last 4 Weeks Cases']  / summarydf['Population'] * 1000,2)
+    summarydf['Fortnightly % Change'] = round((summarydf['Cases in Last Fortnight'] - summarydf['Cases in Previous Fortnight']) / summarydf['Cases in Previous Fortnight'] * 100,0)
+    summarydf['Average Daily Cases'] = round(summarydf['Average Daily Cases'],1)
+    summarydf['Last 7 Days Cases Per 1000 People'] = round(summarydf['Cases in Last 7 Days']  / summarydf['Population'] * 1000,2)
+
+    # Fill NaN with 0, and force integers on cases columns (get converted to floats in merge)
+    summarydf=summarydf.fillna(0)
+    summarydf[['Population','All Time Cases','Peak Daily Cases','Last 4 Weeks Cases','Cases in Last Fortnight','Cases in Previous Fortnight']] = \
+        summarydf[['Population','All Time Cases','Peak Daily Cases','Last 4 Weeks Cases','Cases in Last Fortnight','Cases in Previous Fortnight']].astype(int)
+
+    # Reset index so we get normal area, name, type columns
+    return summarydf.reset_index()
+
+
+def calc_slopes(cases):
+    ''' Returns the slope of the 7 day average over the preceding complete 14 days (we ignore last 2 days)
+        for each row of a 2d array of daily cases (areas x days) '''
+
+    # 7 day rolling averages from cumulative sums
+    cumulative = np.cumsum(np.pad(cases, ((0, 0), (1, 0))), axis=1)
+    averages = (cumulative[:, 7:] - cumulative[:, :-7]) / 7
+
+    # Least squares slope against day number 0..13
+    y = averages[:, -16:-2]
+    x = np.arange(14) - 6.5
+    return np.round((y * x).sum(axis=1) / (x * x).sum(), 2)
+
+
+def get_reporting_periods(dailydf, weeklydf):
+    ''' Returns latest complete week number and start date of the 30 day daily window '''
+
+    return weeklydf['Week'].max(), get_last30(dailydf.index.max())
+
+
+def get_last30(max_date):
+    ''' Returns start date (yyyy-mm-dd) of the daily window used for trend stats '''
+
+    return (datetime.datetime.strptime(max_date.strftime('%d/%m/%Y'), '%d/%m/%Y') - datetime.timedelta(days=TREND_WINDOW_DAYS)).strftime(format='%Y-%m-%d')
+
+
+def partition_by_level(df, levels):
+    ''' Splits dataframe by Area type, returns list of (level, dataframe) in hierarchy order (unknown types last) '''
+
+    types = set(df['Area type'].unique())
+    ordered = [l for l in levels if l in types] + sorted(types - set(levels))
+    return [(level, df.loc[df['Area type'] == level]) for level in ordered]
+
+
+def check_month_totals(month_totals, threshold, leading_empty=False):
+    ''' Sanity checks a level's monthly case totals (None for a month with no data) - returns True if checks fail.
+        With leading_empty, months with no data before the first with data are skipped rather than failed '''
+
+    totals = list(month_totals)
+    while leading_empty and totals and totals[0] is None:
+        totals.pop(0)
+
+    if any(total is None or np.isnan(total) for total in totals):
+        print("Missing or NaN month found in totals - failure detected")
+        return True
+
+    totalcases = sum(totals)
+    print("Total:",totalcases)
+
+    # Should have over threshold cases
+    return bool(totalcases < threshold)
+
+
+def calc_changed_areas(newdf, previousdf):
+    ''' Returns set of area keys with a changed (area, date) cases cell between two versions of daily data.
+        Same outer merge diff as sql.calc_deltas, but on cases only as that's all weekly & summary use '''
+
+    cols = ['Date'] + AREA_KEYS + ['Cases']
+    diff = pd.merge(newdf.reset_index()[cols], previousdf.reset_index()[cols], how='outer', indicator='Exist')
+    changed = diff.loc[diff['Exist'] != 'both']
+
+    return set(changed[AREA_KEYS].itertuples(index=False, name=None))
+
+
+def area_mask(df, areas):
+    ''' Returns boolean mask of dataframe rows that belong to the given area keys '''
+
+    return pd.MultiIndex.from_frame(df[AREA_KEYS]).isin(list(areas))
+
+
+def patch_weekly_summary(dailydf, weeklydf, totalsdf, populationdf, areas, previous_max):
+    ''' Patches copies of the published weekly dataframe & daily totals (see calc_daily_totals) for new daily data, and
+        returns them with a new summary dataframe.  Weekly rows & totals are recomputed for the given (revised) areas
+        only, other areas just get any newly completed weeks appended and the days after previous_max added to their
+        totals.  Summary rows then only need the weekly & trend stats for their reporting periods, so no step scans
+        full daily history for unrevised areas '''
+
+    revised = area_mask(dailydf, areas)
+
+    # Weekly rows - revised areas in full, plus weeks after the last published complete week for everyone
+    published_end = weeklydf['Date'].max()
+    wdf = calc_weekly_cases(dailydf.loc[revised | (dailydf.index > published_end)])
+    wdf = wdf.loc[(wdf['Week'] < get_week(dailydf.index.max()))]
+
+    weeklydf = pd.concat([weeklydf.loc[~area_mask(weeklydf, areas)], wdf], ignore_index=True)
+    weeklydf = weeklydf.sort_values(by=AREA_KEYS+['Date'], kind='mergesort', ignore_index=True)
+
+    # Daily totals - revised areas in full, plus the new days for everyone else
+    newdf = dailydf.loc[(dailydf.index > previous_max) & ~revised]
+    totalsdf = merge_daily_totals([totalsdf.loc[~totalsdf.index.isin(list(areas))], calc_daily_totals(newdf),
+                                   calc_daily_totals(dailydf.loc[revised])])
+
+    week_max, last30 = get_reporting_periods(dailydf, weeklydf)
+    statsdf = calc_totals_stats(totalsdf, weeklydf, week_max, dailydf, last30)
+
+    return weeklydf, calc_summary_cases(populationdf, statsdf), totalsdf
+
+
+def get_week(date):
+    ''' Returns week number (as in weekly cases) of the week containing date '''
+
+    return int((date + pd.Timedelta(days=6 - date.weekday())).strftime('%Y%U'))
+
+
+def check_consistency(dailydf, weeklydf, summarydf, areas=None):
+    ''' Returns True if area case totals in the weekly & summary dataframes agree with the daily data.  Patched areas
+        (or all if areas is None) are also checked for row counts - one weekly row for each week from their first to
+        the last complete week - and every area must have a single summary row '''
+
+    summary = summarydf.set_index(AREA_KEYS)['All Time Cases']
+    daily = dailydf.groupby(AREA_KEYS)['Cases'].sum().reindex(summary.index).fillna(0)
+
+    # Weekly totals should match daily cases up to end of last complete week
+    weekly = weeklydf.groupby(AREA_KEYS)['Cases'].sum()
+    weekly_daily = dailydf.loc[(dailydf.index > '2020-02-29') & (dailydf.index <= weeklydf['Date'].max())]
+    weekly_daily = weekly_daily.groupby(AREA_KEYS)['Cases'].sum().reindex(weekly.index).fillna(0)
+
+    if not ((summary == daily).all() and (weekly == weekly_daily).all()):
+        return False
+
+    # Weeks each area's daily data spans (week ending dates), up to the last complete week
+    dates = dailydf.loc[(dailydf.index > '2020-02-29')].reset_index().groupby(AREA_KEYS)['Date'].agg(['min','max'])
+    if areas is not None:
+        dates = dates.loc[dates.index.isin(list(areas))]
+    first = dates['min'] + pd.to_timedelta(6 - dates['min'].dt.weekday, unit='D')
+    last = (dates['max'] + pd.to_timedelta(6 - dates['max'].dt.weekday, unit='D')).clip(upper=weeklydf['Date'].max())
+    expected = ((last - first).dt.days // 7 + 1).clip(lower=0)
+
+    rows = weeklydf.groupby(AREA_KEYS).size().reindex(expected.index).fillna(0)
+
+    return bool((rows == expected).all() and summary.index.is_unique)
+
+
+######################################################################################################
+# Process pool with shared memory transport
+
+
+def _put_frame(df):
+    ''' Writes dataframe into a new shared memory block as an Arrow IPC stream, returns (name, size) handle '''
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+
+    # Size the block first so the stream can be written straight into shared memory
+    mock = pa.MockOutputStream()
+    writer = pa.ipc.new_stream(mock, table.schema)
+    writer.write_table(table)
+    writer.close()
+    size = mock.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    _write_stream(shm, table)
+    shm.close()
+    return (shm.name, size)
+
+
+def _write_stream(shm, table):
+    ''' Writes arrow table into shared memory block (arrow views are released when we return) '''
+
+    sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+    writer = pa.ipc.new_stream(sink, table.schema)
+    writer.write_table(table)
+    writer.close()
+    sink.close()
+
+
+def _read_stream(buf):
+    ''' Reads dataframe from arrow stream in buffer (columns may be zero-copy views of the buffer) '''
+
+    return pa.ipc.open_stream(pa.py_buffer(buf)).read_all().to_pandas()
+
+
+def _get_frame(handle):
+    ''' Returns dataframe for a shared memory handle (copied out of the block) and frees the block '''
+
+    shm = shared_memory.SharedMemory(name=handle[0])
+    try:
+        return _read_stream(bytes(shm.buf[:handle[1]]))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _free_frame(handle):
+    ''' Frees shared memory block for a handle '''
+
+    shm = shared_memory.SharedMemory(name=handle[0])
+    shm.close()
+    shm.unlink()
+
+
+def _level_worker(task):
+    ''' Pool worker - runs kernel on shared memory partitions (read zero-copy), returns handle to shared memory result '''
+
+    func, handles, args = task
+    blocks = [shared_memory.SharedMemory(name=name) for name, size in handles]
+    frames = [_read_stream(shm.buf[:size]) for shm, (name, size) in zip(blocks, handles)]
+
+    result = _put_frame(func(*frames, *args))
+
+    # Release views of the partitions before unmapping
+    del frames
+    for shm in blocks:
+        shm.close()
+
+    return result
+
+
+def run_level_stage(func, partitions, workers, args=()):
+    ''' Runs kernel over each partition (tuple of dataframes per level) and returns results in partition order.
+        With more than one worker the partitions go through a process pool via shared memory '''
+
+    if workers <= 1 or len(partitions) == 0:
+        return [func(*frames, *args) for frames in partitions]
+
+    handles = [[_put_frame(df) for df in frames] for frames in partitions]
+    results = []
+    try:
+        # Fork so workers don't re-import the batch main module (which starts spark)
+        with multiprocessing.get_context('fork').Pool(processes=min(workers, len(partitions))) as pool:
+            tasks = [pool.apply_async(_level_worker, ((func, h, args),)) for h in handles]
+            for task in tasks:
+                task.wait()
+
+            # Every partition has finished, so if one failed the others' result blocks are still freed below
+            results = [task.get() for task in tasks if task.successful()]
+            for task in tasks:
+                task.get()
+
+        outputs = []
+        while results:
+            outputs.append(_get_frame(results.pop(0)))
+        return outputs
+    finally:
+        for h in [h for frames in handles for h in frames] + results:
+            _free_frame(h)
+
+
+def weekly_stage(dailydf, levels, workers=1):
+    ''' Returns weekly dataframe for daily cases, computed per level '''
+
+    partitions = [(df,) for level, df in partition_by_level(dailydf, levels)]
+    return merge_weekly_cases(run_level_stage(calc_weekly_cases, partitions, workers))
+
+
+def summary_stage(dailydf, weeklydf, populationdf, levels, workers=1):
+    ''' Returns summary dataframe for daily & weekly cases, area stats computed per level '''
+
+    week_max, last30 = get_reporting_periods(dailydf, weeklydf)
+    weekly_levels = dict(partition_by_level(weeklydf, levels))
+    partitions = [(df, weekly_levels.get(level, weeklydf.iloc[0:0])) for level, df in partition_by_level(dailydf, levels)]
+
+    statsdf = pd.concat(run_level_stage(calc_level_stats, partitions, workers, (week_max, last30)))
+    return calc_summary_cases(populationdf, statsdf)
+
+
+def report_scaling(dailydf, populationdf, levels, max_workers):
+    ''' Prints weekly & summary stage timings for 1..max_workers pool workers '''
+
+    print("\nWorkers   Weekly(s)  Summary(s)  Total(s)  Speedup")
+
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        start = time.time()
+        weeklydf = weekly_stage(dailydf, levels, workers)
+        weekly_time = time.time() - start
+
+        start = time.time()
+        summary_stage(dailydf, weeklydf, populationdf, levels, workers)
+        summary_time = time.time() - start
+
+        total = weekly_time + summary_time
+        baseline = baseline or total
+        print(f"{workers:7d} {weekly_time:11.2f} {summary_time:11.2f} {total:9.2f} {baseline/total:8.2f}")
+
+
+
+######################################################################################################
+# Streaming aggregation over month partitions
+
+
+class CasesAccumulator:
+    ''' Running per area accumulators, so daily cases can be folded in one month partition at a time
+        without holding full history in memory.  Keeps totals, peaks, weekly sums and a trailing daily window '''
+
+    def __init__(self):
+
+        self.totals = None      # sum, count, max of daily cases by area
+        self.weekly = None      # weekly case sums by area & week ending date
+        self.window = None      # daily rows within trend window of latest date
+        self.max_date = None
+
+
+    def add(self, dailydf):
+        ''' Folds a daily cases partition into the accumulators '''
+
+        if len(dailydf) == 0:
+            return
+
+        totals = calc_daily_totals(dailydf)
+        if self.totals is None:
+            self.totals, self.window = totals, dailydf[AREA_KEYS+['Cases']]
+        else:
+            self.totals = merge_daily_totals([self.totals, totals])
+            self.window = pd.concat([self.window, dailydf[AREA_KEYS+['Cases']]])
+
+        # Weeks spanning month boundaries get summed across partitions
+        weekdf = dailydf.loc[(dailydf.index > '2020-02-29')]
+        if len(weekdf) > 0:
+            weekly = weekdf.groupby(AREA_KEYS)['Cases'].resample('w').sum()
+            if self.weekly is None:
+                self.weekly = weekly
+            else:
+                self.weekly = pd.concat([self.weekly, weekly]).groupby(level=AREA_KEYS+['Date']).sum()
+
+        # Trim trailing window - anything older can't be in the final window as dates only move forward
+        self.max_date = max(self.max_date or dailydf.index.max(), dailydf.index.max())
+        self.window = self.window.loc[self.window.index >= get_last30(self.max_date)]
+
+
+    def finalize(self, populationdf):
+        ''' Returns weekly and summary dataframes from the accumulated partitions '''
+
+        # Resample again so weeks missing from every partition are filled with zero as in a full resample
+        wdf = self.weekly.rename('Cases').reset_index().set_index('Date')
+        wdf = wdf.groupby(AREA_KEYS)['Cases'].resample('w').sum().reset_index()
+        wdf['Week'] = wdf['Date'].dt.strftime('%Y%U').astype("int")
+        wdf['Cases'] = wdf['Cases'].astype(int)
+        weeklydf = merge_weekly_cases([wdf])
+
+        statsdf = calc_totals_stats(self.totals, weeklydf, weeklydf['Week'].max(), self.window.sort_index(), get_last30(self.max_date))
+
+        return weeklydf, calc_summary_cases(populationdf, statsdf)
+
+
+def peak_rss_mb():
+    ''' Returns peak resident memory of this process in MB '''
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
@@ -0,0 +1,185 @@
+''' Read only data API - daily & weekly series and summary rows from the loaded cases data, as JSON, Arrow or Parquet.
+
+    /api/daily?level=Region&area=London&start=2020-09-01&end=2020-09-30&columns=Cases,Tests&format=arrow
+    /api/weekly?level=Region&area=London
+    /api/summary?level=Region&columns=Area name,Population
+
+    level is required, area is optional (all areas at the level), dates are inclusive (yyyy-mm-dd) '''
+
+import flask
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+API_MAX_AGE = 60    # Seconds clients may reuse a response for before revalidating (ETag)
+
+FORMATS = {
+    'json' : 'application/json',
+    'arrow' : 'application/vnd.apache.arrow.stream',
+    'parquet' : 'application/vnd.apache.parquet'
+}
+
+
+class ApiError(Exception):
+    ''' Bad API request '''
+
+
+def create_api(cases):
+    ''' Returns Flask blueprint of data API routes serving the current cases data snapshot '''
+
+    api = flask.Blueprint('api', __name__, url_prefix='/api')
+
+    @api.route('/daily')
+    def daily():
+        ''' Daily series by level, area & date range '''
+
+        return respond(cases.snapshot, lambda snapshot: get_daily(snapshot, flask.request.args))
+
+    @api.route('/weekly')
+    def weekly():
+        ''' Weekly series by level, area & date range '''
+
+        return respond(cases.snapshot, lambda snapshot: get_weekly(snapshot, flask.request.args))
+
+    @api.route('/summary')
+    def summary():
+        ''' Summary rows by level & area '''
+
+        return respond(cases.snapshot, lambda snapshot: get_summary(snapshot, flask.request.args))
+
+    return api
+
+
+def respond(snapshot, query):
+    ''' Returns response for query on snapshot, in the requested format with a data generation ETag
+        (or not modified if the client already has it) '''
+
+    try:
+        fmt = flask.request.args.get('format', 'json')
+        if fmt not in FORMATS:
+            raise ApiError('format must be one of ' + ', '.join(FORMATS))
+
+        etag = hashlib.md5((str(snapshot.latest_data_load_timestamp) + flask.request.full_path).encode()).hexdigest()
+        if etag in flask.request.if_none_match:
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(serialise(query(snapshot), fmt), mimetype=FORMATS[fmt])
+
+    except ApiError as e:
+        return flask.jsonify({'error' : str(e)}), 400
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=' + str(API_MAX_AGE)
+    return response
+
+
+def serialise(df, fmt):
+    ''' Returns dataframe as bytes in format '''
+
+    if fmt == 'json':
+        return df.to_json(orient='records', date_format='iso')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+
+    if fmt == 'arrow':
+        writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    else:
+        pq.write_table(table, sink)
+
+    return sink.getvalue().to_pybytes()
+
+
+def get_daily(snapshot, args):
+    ''' Returns daily series rows for request args '''
+
+    level, area = get_level_area(snapshot, args)
+    df = snapshot.dailydf.iloc[get_rows(snapshot.daily_rows, level, area)]
+
+    start, end = get_dates(args)
+    df = df.loc[start:end].reset_index()
+
+    return project(df, args, ['Date','Area name','Area code','Area type'])
+
+
+def get_weekly(snapshot, args):
+    ''' Returns weekly series rows for request args '''
+
+    level, area = get_level_area(snapshot, args)
+    df = snapshot.weeklydf.iloc[get_rows(snapshot.weekly_rows, level, area)]
+
+    start, end = get_dates(args)
+    if start is not None:
+        df = df.loc[df['Date'] >= start]
+    if end is not None:
+        df = df.loc[df['Date'] <= end]
+
+    return project(df, args, ['Date','Area name','Area code','Area type'])
+
+
+def get_summary(snapshot, args):
+    ''' Returns summary rows for request args '''
+
+    level, area = get_level_area(snapshot, args)
+    df = snapshot.summarydf.loc[snapshot.summarydf['Area type'] == level]
+    if area is not None:
+        df = df.loc[df['Area name'] == area]
+
+    return project(df, args, ['Area name','Area code','Area type'])
+
+
+def get_level_area(snapshot, args):
+    ''' Returns (level, area or None) from request args '''
+
+    level = args.get('level')
+    if level not in snapshot.hierachy_sets:
+        raise ApiError('level must be one of ' + ', '.join(snapshot.levels))
+
+    area = args.get('area')
+    if area is not None and area not in snapshot.hierachy_sets[level]:
+        raise ApiError('unknown area ' + area + ' for level ' + level)
+
+    return level, area
+
+
+def get_rows(rows, level, area):
+    ''' Returns row positions of an area (or all areas at level) from an area row index '''
+
+    if area is not None:
+        return rows.get((level, area), [])
+
+    levelrows = [positions for (arealevel, name), positions in rows.items() if arealevel == level]
+    return np.sort(np.concatenate(levelrows)) if levelrows else []
+
+
+def get_dates(args):
+    ''' Returns (start, end) dates from request args (None if not given) '''
+
+    try:
+        dates = [pd.Timestamp(args[arg]) if arg in args else None for arg in ['start', 'end']]
+    except ValueError:
+        raise ApiError('dates must be yyyy-mm-dd')
+
+    # Empty values (start=) and 'NaT' parse as NaT rather than raising, and would match no rows
+    if any(date is pd.NaT for date in dates):
+        raise ApiError('dates must be yyyy-mm-dd')
+
+    return dates
+
+
+def project(df, args, keys):
+    ''' Returns requested columns of dataframe (with area / date key columns), or all columns '''
+
+    if 'columns' not in args:
+        return df
+
+    columns = args['columns'].split(',')
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise ApiError('unknown columns ' + ', '.join(unknown))
+
+    return df[[c for c in keys if c in df.columns and c not in columns] + columns]
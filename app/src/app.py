@@ -7,7 +7,8 @@ import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 import flask
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import pandas as pd
 import json
 import os
@@ -24,14 +25,20 @@ app.title = 'Covid-19 Tracker'
       
 PLOTLY_LOGO = 'https://images.plot.ly/logo/new-branding/plotly-logomark.png'
 DEFAULT_MAP_MEASURE = 'Last 14 Days Trend Slope'
-REFRESH_INTERVAL = 60 * 1000 * 5   # Check for new data every 5 minutes
+GENERATION_WAIT_SECONDS = 2    # Longest a data generation check waits for new data (it holds a request thread meanwhile)
+RESPONSE_MAX_AGE = 10           # Seconds nginx & browsers may reuse layout / callback responses for (micro-caching)
+RESPONSE_CACHE_SIZE = 512       # Most layout / callback responses we keep per worker
+CACHED_PATHS = ['/_dash-layout', '/_dash-update-component']
 
 # Load our app utilities
 
 from dataframes import CasesData
-from tables import TableLayout
-from charts import ChartLayout, Chart
-from dashboard import DashboardLayout, Map, MapCardLayout
+from tables import TableLayout, table_views
+from charts import ChartLayout, Chart, ChartSeries, figure_cache
+from dashboard import DashboardLayout, MapCardLayout, MAP_CUSTOMDATA, MAP_ZOOM, map_figures
+from api import create_api
+from rendercache import RenderCache, ResponseCache, SingleFlight, render_key, RENDER_WAIT_SECONDS
+from warmer import CacheWarmer, WARM_HEADER
 
 
 def decode_urlpath(path):
@@ -50,6 +57,143 @@ def decode_urlpath(path):
     return list(map(lambda st: urllib.parse.unquote(st), urlparams[offset:] ))
 
 
+@server.route('/geo/<filename>')
+def geo_file(filename):
+    ''' Map boundary geojson by fingerprinted file name, cacheable indefinitely (nginx serves these directly in docker) '''
+
+    if filename not in cases.geo_files:
+        flask.abort(404)
+
+    response = flask.send_from_directory(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"), cases.geo_files[filename], mimetype="application/json")
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@server.route('/generation')
+def data_generation():
+    ''' Current data generation, checked by browsers (assets/refresh.js) so they only refresh when data has changed.
+        If the caller already has the current generation we wait briefly for a new one, never holding a thread for long '''
+
+    if flask.request.args.get('since') == str(cases.snapshot.latest_data_load_timestamp):
+        cases.wait_for_load(GENERATION_WAIT_SECONDS)
+
+    response = flask.jsonify({'generation': str(cases.snapshot.latest_data_load_timestamp)})
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@server.route('/stats')
+def cache_stats():
+    ''' Application cache counters '''
+
+    return flask.jsonify({'figure_cache': figure_cache.stats(), 'response_cache': response_cache.stats(), 'render_cache': render_cache.stats(),
+                          'in_flight': in_flight.stats(), 'cache_warming': cache_warmer.stats()})
+
+
+######################################################################################################
+# Conditional responses.  Layout & callback responses only depend on the data generation and the request
+# (path & body - callback inputs), so repeats are answered from cache with an ETag, or a 304 if the client has it.
+# Responses are kept by this worker, and in the redis render cache shared with every other worker (render_cache).
+# Identical requests arriving together wait for the first to render (in_flight) rather than all rendering it.
+# Each request is pinned to the data snapshot its cache key was made from, so a response is never cached under
+# one generation having been rendered from another (callbacks use request_snapshot, not cases.snapshot)
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+in_flight = SingleFlight()
+
+
+def request_snapshot():
+    ''' Returns the data snapshot this request is pinned to (or the current one for requests that aren't) '''
+
+    if flask.has_request_context() and 'snapshot' in flask.g:
+        return flask.g.snapshot
+
+    return cases.snapshot
+
+
+@server.before_request
+def cached_response():
+    ''' Returns cached response (or not modified) for repeat layout / callback requests '''
+
+    if flask.request.path not in CACHED_PATHS:
+        return None
+
+    flask.g.snapshot = cases.snapshot
+    flask.g.generation = flask.g.snapshot.latest_data_load_timestamp
+    flask.g.etag = render_key(flask.g.generation, flask.request.path, flask.request.get_data(as_text=True))
+
+    if flask.g.etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+    else:
+        body = response_cache.get(flask.g.etag, flask.g.generation)
+
+        # Wait for the same request in flight on another thread
+        waited = False
+        if body is None:
+            if in_flight.join(flask.g.etag):
+                flask.g.leading = True
+            else:
+                waited = True
+                body = response_cache.get(flask.g.etag, flask.g.generation)
+
+        # Not rendered by this worker - use (or wait for) another worker's render, or claim it and render it ourselves.
+        # Waits are short (a second or so) and never repeated, after that we render it ourselves
+        if body is None and flask.g.generation is not None:
+            body = render_cache.get(flask.g.etag, wait=0 if waited else RENDER_WAIT_SECONDS)
+            if body is None:
+                flask.g.rendering = True
+                return None
+            response_cache.put(flask.g.etag, flask.g.generation, body)
+
+        if body is None:
+            return None
+        response = flask.Response(body, mimetype='application/json')
+
+    flask.g.cached = True
+    return response
+
+
+@server.teardown_request
+def finish_response(exception):
+    ''' Releases requests waiting for this one (after its response is cached, or it failed) '''
+
+    if flask.g.get('leading'):
+        in_flight.finish(flask.g.etag)
+
+
+@server.after_request
+def cache_response(response):
+    ''' Adds ETag & cache headers to layout / callback responses, and keeps new ones '''
+
+    if 'etag' not in flask.g:
+        return response
+
+    rendered = response.status_code == 200 and not flask.g.get('cached') and not flask.g.get('uncacheable')
+    if flask.g.get('rendering'):
+        if rendered:
+            render_cache.put(flask.g.etag, response.get_data())
+        else:
+            render_cache.release(flask.g.etag)
+
+    if response.status_code not in (200, 304):
+        return response
+
+    if flask.g.get('uncacheable'):
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    response.set_etag(flask.g.etag)
+    response.headers['Cache-Control'] = 'public, max-age=' + str(RESPONSE_MAX_AGE)
+
+    if rendered:
+        response_cache.put(flask.g.etag, flask.g.generation, response.get_data())
+
+    if WARM_HEADER not in flask.request.headers:
+        cache_warmer.record(flask.request.path, flask.request.get_data(as_text=True))
+
+    return response
+
+
 ######################################################################################################
 # Dash application call backs
 
@@ -75,11 +219,14 @@ def toggle_navbar_collapse(n, is_open):
 def display_mapchart(clickData):
     '''  Plot trend charts when map area is clicked '''
 
+    # Use one data snapshot throughout, in case new data is swapped in part way
+    snapshot = request_snapshot()
+
     print('MAP TREND CALLBACK')
 
     # Initial default line chart options - England
     plotparams = { 
-        'plotlevel' : cases.levels[0],
+        'plotlevel' : snapshot.levels[0],
         'plotareas' : 'England',
         'plotvars' : 'Cases|Average',
         'plottitle' : '',
@@ -92,80 +239,92 @@ def display_mapchart(clickData):
         # Get plot parameters from clicked map area
         
         print(clickData)
-        data = clickData['points'][0]['customdata']
-        plotparams['plotareas']  = data[1]
-        plotparams['plotlevel']  = cases.get_plot_level(data[1]) 
+        data = dict(zip(MAP_CUSTOMDATA, clickData['points'][0]['customdata']))
+        plotparams['plotareas']  = data['Area name']
+        plotparams['plotlevel']  = data['Area type']
 
     else:
         # Use initial default parameters, if nothing selected on map
-        data = pd.Series(cases.summarydf.loc[(cases.summarydf['Area type'] == plotparams['plotlevel']) & (cases.summarydf['Area name'] == plotparams['plotareas'])].iloc[0])
+        data = pd.Series(snapshot.summarydf.loc[(snapshot.summarydf['Area type'] == plotparams['plotlevel']) & (snapshot.summarydf['Area name'] == plotparams['plotareas'])].iloc[0])
 
     # Create daily trend chart next to map
-    daily_chart = Chart(plotparams, cases)
+    daily_chart = Chart(plotparams, snapshot)
 
     # Create weekly bar chart below map
-    plotparams['plottitle'] = 'Weekly Change in Cases - '+ plotparams['plotareas']
-    plotparams['plotvars'] = 'Cases:bar'
-    plotparams['periodicity'] = 'weekly'
-    plotparams['showtitle'] = True
-    plotparams['plotdays'] = 0
+    weekly_chart = Chart(dict(plotparams, plottitle='Weekly Change in Cases - '+ plotparams['plotareas'], plotvars='Cases:bar',
+                            periodicity='weekly', showtitle=True, plotdays=0), snapshot)
 
-    weekly_chart = Chart(plotparams, cases)
-
-    map_card = MapCardLayout(plotparams=plotparams, cases=cases, cardfigs=data, chart=daily_chart.figure)
+    map_card = MapCardLayout(plotparams=plotparams, cases=snapshot, cardfigs=data, chart=daily_chart.figure)
 
     return weekly_chart.figure, map_card.layout
 
 
 
 @app.callback(
-    Output('map', 'figure'),
+    [Output('map', 'figure'),
+    Output('map_resolution', 'data')],
     [Input('map_level_dd', 'value'),
-    Input('map_measure_dd', 'value')]
+    Input('map_measure_dd', 'value'),
+    Input('map', 'relayoutData')],
+    [State('map_resolution', 'data')]
 )
-def display_map(selmaplevel, selmapmeasure):
-    ''' Main Dashboard - Display map when map level and measure dropdowns are selected '''
+def display_map(selmaplevel, selmapmeasure, relayoutData, shownresolution):
+    ''' Main Dashboard - Display map when map level and measure dropdowns are selected, 
+        or with more / less detailed boundaries when zooming changes the resolution needed '''
+
+    # Use one data snapshot throughout, in case new data is swapped in part way
+    snapshot = request_snapshot()
+
+    zoom = (relayoutData or {}).get('mapbox.zoom', MAP_ZOOM)
+    resolution = cases.get_geo_resolution(selmaplevel, zoom)
 
-    print('MAP CALLBACK - map plot level',selmaplevel,'map plot measure',selmapmeasure)
+    if dash.callback_context.triggered[0]['prop_id'] == 'map.relayoutData' and resolution == shownresolution:
+        raise PreventUpdate
+
+    print('MAP CALLBACK - map plot level',selmaplevel,'map plot measure',selmapmeasure,'resolution',resolution)
 
     mapparams = {
         'plotlevel' : selmaplevel,
-        'plotmeasure' : selmapmeasure
+        'plotmeasure' : selmapmeasure,
+        'resolution' : resolution
     }
-    map = Map(mapparams, cases)
-    return map.figure #create_map(selmaplevel, selmapmeasure, cases)
+    return map_figures.get(mapparams, snapshot), resolution
 
 
 
 @app.callback(
     Output('plotareadd', 'options'),
-    [Input('plotleveldd', 'value')],
+    [Input('plotleveldd', 'value'),
+    Input('plotareadd', 'search_value')],
+    [State('plotareadd', 'value')]
 )
-def set_plotarea_options(selplotlevel):
-    ''' Populate chart plot area dropdown when plot level dropdown is set (Interactive chart) '''
+def set_plotarea_options(selplotlevel, search, selplotarea):
+    ''' Populate chart plot area dropdown when plot level dropdown is set, or search text typed for large levels (Interactive chart) '''
 
-    print('PLOT AREA CALLBACK - selplotlevel',selplotlevel)
+    print('PLOT AREA CALLBACK - selplotlevel',selplotlevel,'search',search)
 
-    return [{'label': i, 'value': i} for i in cases.hierachy[selplotlevel]]
+    return request_snapshot().get_area_options(selplotlevel, search=search, value=selplotarea)
 
 
 
 @app.callback(
-    [Output('graph1', 'figure'),
-    Output('graph2', 'figure')],
+    Output('chart-series', 'data'),
     [Input('plotleveldd', 'value'),
     Input('plotareadd', 'value'),
     Input('intermediate-value', 'children')]
     )
-def update_adhoc_graphs(selected_plotlevel, selected_plotarea, json_params):
-    ''' Update Interactive graphs when plot level and plot area selected '''
+def update_adhoc_series(selected_plotlevel, selected_plotarea, json_params):
+    ''' Send series for Interactive graphs when plot level and plot area selected (charts are drawn in the browser) '''
+
+    # Use one data snapshot throughout, in case new data is swapped in part way
+    snapshot = request_snapshot()
 
     print('ADHOC CALLBACK selplotlevel:',selected_plotlevel, 'sel area:',selected_plotarea)
 
     # Get current plot parameters from hidden intermediate-value div
     plotparams = json.loads(json_params)
 
-    if selected_plotarea.replace('%20',' ') not in cases.hierachy[selected_plotlevel] :
+    if selected_plotarea.replace('%20',' ') not in snapshot.hierachy_sets[selected_plotlevel] :
         print('Warning, area doesnt exist')
         area = ''
     else:
@@ -174,23 +333,47 @@ def update_adhoc_graphs(selected_plotlevel, selected_plotarea, json_params):
     plotparams['plotlevel'] = selected_plotlevel
     plotparams['plotareas'] = area
 
-    # Update charts
-    chart1 = Chart(plotparams, cases)
-    plotparams['plotdays'] = 0
-    chart2 = Chart(plotparams,cases)
+    return ChartSeries(plotparams, snapshot).data
+
+
+
+# Interactive graphs - drawn in the browser from the area series, for the selected number of days (and all days)
+app.clientside_callback(
+    ClientsideFunction(namespace='charts', function_name='trend_figures'),
+    [Output('graph1', 'figure'),
+    Output('graph2', 'figure')],
+    [Input('chart-series', 'data'),
+    Input('plotdaysradio', 'value')]
+)
 
-    return chart1.figure, chart2.figure
+
+
+@app.callback(
+    [Output('datatable-interactivity', 'data'),
+    Output('datatable-interactivity', 'page_count')],
+    [Input('datatable-interactivity', 'page_current'),
+    Input('datatable-interactivity', 'page_size'),
+    Input('datatable-interactivity', 'sort_by'),
+    Input('datatable-interactivity', 'filter_query')],
+    [State('table-params', 'data')],
+    prevent_initial_call=True
+)
+def update_table_page(page_current, page_size, sort_by, filter_query, tableparams):
+    ''' Tables - serve page of table data when paging, sorting or filtering '''
+
+    print('TABLE PAGE CALLBACK',tableparams['link'],page_current,sort_by,filter_query)
+
+    return table_views.get(tableparams, request_snapshot()).page(page_current, page_size, sort_by, filter_query)
 
 
 
 @app.callback(Output('latest_cases_date', 'children'),
-            [Input('interval-component', 'n_intervals')])
+            [Input('data-refresh', 'n_clicks')])
 def update_data(n):
-    ''' Data refresh interval callback.  Loads new data if we have any '''
+    ''' Data refresh callback, triggered (by assets/refresh.js) when the data generation changes '''
 
     print('UPDATE DATA CALLBACK STARTED')
-    cases.load()
-    return html.Div('Data to: '+cases.latest_case_date)
+    return html.Div('Data to: '+request_snapshot().latest_case_date)
 
 
 
@@ -200,6 +383,9 @@ def update_data(n):
 def render_page_content(path):
     ''' Main application start callback, serves up appropriate page depending on URL '''
 
+    # Use one data snapshot throughout, in case new data is swapped in part way
+    snapshot = request_snapshot()
+
     if path is not None:
         
         # decode url path to set up plot parameters
@@ -211,12 +397,12 @@ def render_page_content(path):
         if urlparams[1] in ['', 'link1']:
         
             mapparams = {
-                'plotlevel' : cases.levels[2],
+                'plotlevel' : snapshot.levels[2],
                 'plotmeasure' : DEFAULT_MAP_MEASURE
             }
 
             print('CREATING DASHBOARD LAYOUT',mapparams)
-            dashboard = DashboardLayout(mapparams=mapparams, cases=cases)
+            dashboard = DashboardLayout(mapparams=mapparams, cases=snapshot)
             return dashboard.layout, None
 
 
@@ -235,7 +421,34 @@ def render_page_content(path):
             }
 
             print('CREATING CHARTS LAYOUT',plotparams)
-            chart = ChartLayout(plotparams=plotparams, cases=cases)
+            chart = ChartLayout(plotparams=plotparams, cases=snapshot)
+            return chart.layout, json.dumps(plotparams)
+
+
+        # Find area containing a location (lat/lon) and show its interactive chart
+        elif urlparams[1] == 'find':
+
+            try:
+                found = snapshot.find_area(float(urlparams[2]), float(urlparams[3]))
+            except (IndexError, ValueError):
+                return html.Div(id='find',children=[html.P('Allow location access to find your area.')]), None
+
+            if found is None:
+                return html.Div(id='find',children=[html.P('No area found for this location.')]), None
+
+            plotparams = {
+                'link' : 'chart7',
+                'plotlevel' : found[0],
+                'plotareas' : found[1],
+                'plotvars' : 'Cases|Average',
+                'plottitle' : 'Daily Cases:*',
+                'plotdays' : 28,
+                'showtitle' : True,
+                'periodicity' : 'daily'
+            }
+
+            print('CREATING FIND AREA CHARTS LAYOUT',plotparams)
+            chart = ChartLayout(plotparams=plotparams, cases=snapshot)
             return chart.layout, json.dumps(plotparams)
 
 
@@ -250,12 +463,13 @@ def render_page_content(path):
             }
 
             print('CREATING TABLE LAYOUT',tableparams)
-            table = TableLayout(tableparams=tableparams, df=cases.summarydf)
+            table = TableLayout(tableparams=tableparams, view=table_views.get(tableparams, snapshot))
             return table.layout, None
 
 
-        # Batch log
+        # Batch log (changes independently of the case data, so never cached)
         elif urlparams[1] in ['log']:
+            flask.g.uncacheable = True
             log_file = os.path.dirname(__file__)+'/data/batch.log'
             if os.path.exists(log_file):
                 with open(log_file) as f:
@@ -277,8 +491,17 @@ def render_page_content(path):
     else:
         return None, None
 
-# Load our data structures
+# Load our data structures, and prebuild map figures & table views now and after each new data load
 cases = CasesData()
+map_figures.prebuild(cases.snapshot)
+table_views.prebuild(cases.snapshot)
+cases.load_listeners.extend([map_figures.prebuild, table_views.prebuild])
+
+# Rendered responses shared with the other workers
+render_cache = RenderCache(cases.redis_connection)
+
+# Data API
+server.register_blueprint(create_api(cases))
 
 
 ######################################################################################################
@@ -290,7 +513,7 @@ links_bar = dbc.Row(
         dbc.Col(
             children=[
                 dbc.Row(html.A(html.Div('Source Data: coronavirus.data.gov.uk'),href='https://coronavirus.data.gov.uk/about',style={'font-size':'80%','text-decoration':'none','color':'white'}),justify='end'),
-                dbc.Row(html.A(html.Div('Data to: '+cases.latest_case_date,id='latest_cases_date'),href='https://coronavirus.data.gov.uk/about',style={'font-size':'70%','text-decoration':'none','color':'white'}),justify='end')
+                dbc.Row(html.A(html.Div('Data to: '+cases.snapshot.latest_case_date,id='latest_cases_date'),href='https://coronavirus.data.gov.uk/about',style={'font-size':'70%','text-decoration':'none','color':'white'}),justify='end')
             ],width='auto',className='pr-3'
         ),
         dbc.Col(dbc.DropdownMenu(
@@ -304,17 +527,20 @@ links_bar = dbc.Row(
                 dbc.DropdownMenuItem('Interactive - Cases', href='/chart7/'+cases.levels[1]+'/East Midlands/Cases|Average/Daily Cases:*/28/'),
                 dbc.DropdownMenuItem('Interactive - Hospital Cases', href='/chart7/'+cases.levels[0]+'/England/Hospital Cases|Average Hospital Cases/Hospital Cases:*/28/'),
                 dbc.DropdownMenuItem('Interactive - Deaths', href='/chart7/'+cases.levels[0]+'/England/Deaths within 28 Days of Positive Test|Average Deaths/Deaths:*/28/'),
+                dbc.DropdownMenuItem('Find My Area', id='find-my-area', href='/find'),
             ],
             right=True,
             label='Charts',
         ),width='auto',className='pr-0'),
         dbc.Col(dbc.DropdownMenu(
             children=[
-                dbc.DropdownMenuItem('Local Authorities with Increasing Fortnightly Cases', href='/table1/'+cases.levels[3]+'/Local Authorities with Increasing Fortnightly Cases (To Week Ending '+cases.latest_complete_week+')'),
+                dbc.DropdownMenuItem('Local Authorities with Increasing Fortnightly Cases', href='/table1/'+cases.levels[3]+'/Local Authorities with Increasing Fortnightly Cases (To Week Ending '+cases.snapshot.latest_complete_week+')'),
                 dbc.DropdownMenuItem('Local Authorities with Rising 14 Day Case Trend', href='/table2/'+cases.levels[3]+'/Local Authorities with Rising 14 Day Case Trend'),
                 dbc.DropdownMenuItem('Summarised Data - Region', href='/table3/'+cases.levels[1]+'/Summarised Data - Region'),
                 dbc.DropdownMenuItem('Summarised Data - Upper Tier Authorities', href='/table3/'+cases.levels[2]+'/Summarised Data - Upper Tier Authorities'),
-                dbc.DropdownMenuItem('Summarised Data - Lower Tier Authorities', href='/table3/'+cases.levels[3]+'/Summarised Data - Lower Tier Authorities')
+                dbc.DropdownMenuItem('Summarised Data - Lower Tier Authorities', href='/table3/'+cases.levels[3]+'/Summarised Data - Lower Tier Authorities'),
+                dbc.DropdownMenuItem('Hotspot Clusters - Rising 14 Day Case Trend', href='/table4/'+cases.levels[3]+'/Clusters of Neighbouring Local Authorities with Rising 14 Day Case Trend'),
+                dbc.DropdownMenuItem('Hotspot Clusters - Weekly Cases Per 1000 People', href='/table5/'+cases.levels[3]+'/Clusters of Neighbouring Local Authorities with Over 1 Case Per 1000 People in Last 7 Days')
             ],
             right=True,
             label='Tables',
@@ -333,7 +559,7 @@ header = dbc.Navbar(
                 [
                     dbc.Col(html.Img(src=PLOTLY_LOGO, height='30px'),width = 2),
                     dbc.Col(dbc.NavbarBrand('UK Covid-19 Tracker'),className='pl-2'),
-                    dbc.Col(id='live-update-text'),  # Dummy div used to force data updates on polling interval
+                    dbc.Col(id='live-update-text'),  # Dummy div used to force data updates on new data
                 ],
                 align='center',
                 no_gutters=True,
@@ -351,21 +577,38 @@ header = dbc.Navbar(
 content = html.Div(id='page-content')
 
 
+def link_paths(component):
+    ''' Returns url paths of the links in a layout component tree '''
+
+    children = getattr(component, 'children', None)
+    children = children if isinstance(children, list) else [children] if children is not None else []
+    href = getattr(component, 'href', None)
+
+    return ([href] if isinstance(href, str) and href.startswith('/') else []) + [path for child in children for path in link_paths(child)]
+
+
+# Pages rendered into the cache as soon as new data is published (with the most requested callbacks).
+# The home page dashboard and every chart & table in the links bar
+WARM_PAGES = ['/'] + [path for path in link_paths(links_bar) if path != '/find']
+
+cache_warmer = CacheWarmer(server, cases, WARM_PAGES)
+
+
 def serve_layout():
     ''' Main application layout function, called on every browser force refresh and app home page '''
 
     print('\nSERVING LAYOUT')
 
-    # Make sure we have the latest data loaded
-    cases.load()
-
-    # Return our web page header and main content 
+    # Return our web page header and main content (new data is loaded when the batch announces it)
     return html.Div([dcc.Location(id='url'), header, content,  
             html.Div(id='intermediate-value', style={'display': 'none'}),
-            dcc.Interval(id='interval-component', interval=REFRESH_INTERVAL, n_intervals=0)])
+            html.Button(id='data-refresh', style={'display': 'none'})])
 
 app.layout = serve_layout
 
+# Warm the render cache for the loaded data, and each new load
+cache_warmer.start()
+
 
 print('\nFinished Loading....')
 
@@ -0,0 +1,137 @@
+// Interactive chart (chart7) figures, drawn in the browser from the compact area series sent by the server
+// (charts.py ChartSeries).  Mirrors the server side trend charts (charts.py Chart) - rolling averages, styles & titles
+
+(function() {
+
+    var IGNORE_DAYS = 3;        // Averages exclude the latest (incomplete) days
+    var COLOURS = ['Blue','Red','Green','Yellow','Pink','Cyan','Purple','Black','Orange','Grey'];
+    var AXES_DEFAULTS = {showgrid: true, gridwidth: 1, gridcolor: '#E8E8E8', showline: true, linewidth: 1, linecolor: 'black'};
+
+    var SERIES_COLUMNS = {
+        'Cases': 'Cases', 'Average': 'Cases', 'Tests': 'Tests',
+        'Hospital Cases': 'Hospital Cases', 'Average Hospital Cases': 'Hospital Cases',
+        'Deaths within 28 Days of Positive Test': 'Deaths within 28 Days of Positive Test',
+        'Average Deaths': 'Deaths within 28 Days of Positive Test'
+    };
+
+    function dates(start, count) {
+        var result = [];
+        var date = new Date(start + 'T00:00:00Z');
+        for (var i = 0; i < count; i++) {
+            result.push(date.toISOString().substring(0, 10));
+            date.setUTCDate(date.getUTCDate() + 1);
+        }
+        return result;
+    }
+
+    function withoutZeros(values) {
+        return values.map(function(v) { return v === 0 ? null : v; });
+    }
+
+    // 7 day rolling average (missing if any day in the window is missing), excluding the latest days
+    function rollingAverage(values) {
+        return values.map(function(v, i) {
+            if (i < 6 || i >= values.length - IGNORE_DAYS) {
+                return null;
+            }
+            var total = 0;
+            for (var j = i - 6; j <= i; j++) {
+                if (values[j] === null) {
+                    return null;
+                }
+                total += values[j];
+            }
+            return Math.round(total / 7 * 100) / 100;
+        });
+    }
+
+    function plotValues(variable, values) {
+        var column = values[SERIES_COLUMNS[variable]];
+
+        if (variable === 'Tests') {
+            return rollingAverage(withoutZeros(column));
+        } else if (variable === 'Hospital Cases') {
+            return withoutZeros(column);
+        } else if (variable === 'Average Hospital Cases') {
+            return rollingAverage(withoutZeros(column));
+        } else if (variable.indexOf('Average') === 0) {
+            return rollingAverage(column);
+        }
+        return column;
+    }
+
+    function plotAttributes(variable, i) {
+        if (variable.indexOf('Average') === 0) {
+            return [{color: COLOURS[i]}, 1];
+        } else if (variable === 'Cases' || variable === 'Hospital Cases' || variable.indexOf('Death') === 0) {
+            return [{dash: 'dot', color: COLOURS[i]}, 0.3];
+        } else if (variable.indexOf('Tests') !== -1) {
+            return [{dash: 'dash', color: 'Pink'}, 1];
+        }
+        return [{color: COLOURS[i]}, 1];
+    }
+
+    function plotName(area, variable, plotvars) {
+        var suffix = '';
+        if (variable.indexOf('Average') === 0 && plotvars.length > 1) {
+            suffix = ' 7 Day Avg';
+        } else if (variable === 'Tests') {
+            suffix = ' Tests';
+        } else if (variable === 'Hospital Cases' || variable.indexOf('Death') === 0) {
+            suffix = ' ' + variable;
+        }
+        return area + suffix;
+    }
+
+    function trendFigure(series, plotdays) {
+        var params = series.plotparams;
+        var plotvars = params.plotvars.split('|');
+        var first = Object.keys(series.values)[0];
+        var x = dates(series.start, series.values[first].length);
+        var from = plotdays > 0 ? Math.max(0, x.length - plotdays) : 0;
+
+        var layout = {
+            plot_bgcolor: 'white', title: {text: '', x: 0.01}, legend: {orientation: 'h'},
+            margin: {l: 20, r: 20, t: 60, b: 30},
+            xaxis: Object.assign({}, AXES_DEFAULTS), yaxis: Object.assign({}, AXES_DEFAULTS)
+        };
+
+        var data = plotvars.map(function(plotvar) {
+            var vars = plotvar.split(':');
+            var attributes = plotAttributes(vars[0], 0);
+            var y = plotValues(vars[0], series.values).slice(from);
+            var yaxis = vars.indexOf('y2') !== -1 ? 'y2' : 'y';
+
+            if (yaxis === 'y2') {
+                layout.yaxis2 = Object.assign({}, AXES_DEFAULTS, {title: {text: vars[0]}, color: 'pink', rangemode: 'tozero', showgrid: false,
+                                                                   overlaying: 'y', side: 'right'});
+                layout.yaxis.title = {text: plotvars[0]};
+            }
+
+            if (vars.indexOf('bar') !== -1) {
+                return {type: 'bar', x: x.slice(from), y: y, name: plotName(params.plotareas, vars[0], plotvars), yaxis: yaxis,
+                        marker: {color: y.map(function(v) { return v > 0 ? 'red' : 'green'; })}};
+            }
+            return {type: 'scatter', mode: 'lines', x: x.slice(from), y: y, name: plotName(params.plotareas, vars[0], plotvars),
+                    opacity: attributes[1], line: attributes[0], yaxis: yaxis};
+        });
+
+        // Chart title depending on number of days, plot areas
+        var suffix = plotdays > 0 ? ' - Last ' + plotdays + ' Days' : '';
+        var title = params.plottitle.split(':');
+        layout.title.text = title.length > 1 ? title[0] + ' - ' + params.plotareas.replace(/\|/g, ', ') + suffix : title[0] + suffix;
+
+        return {data: data, layout: layout};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        charts: {
+            trend_figures: function(series, plotdays) {
+                if (!series || !series.start) {
+                    return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+                }
+                return [trendFigure(series, plotdays), trendFigure(series, 0)];
+            }
+        }
+    });
+})();
@@ -0,0 +1,18 @@
+// "Find My Area" menu item - use browser location to open the chart for the area we're in
+
+document.addEventListener('click', function(event) {
+    var link = event.target.closest('#find-my-area');
+    if (!link || !navigator.geolocation) {
+        return;
+    }
+
+    event.preventDefault();
+    navigator.geolocation.getCurrentPosition(
+        function(position) {
+            window.location.href = '/find/' + position.coords.latitude.toFixed(5) + '/' + position.coords.longitude.toFixed(5);
+        },
+        function() {
+            window.location.href = '/find';
+        }
+    );
+});
@@ -0,0 +1,31 @@
+// Data refresh - check the server's data generation every 30 seconds, and click the hidden refresh button when it changes.
+// Each check is a short request (the server waits at most a couple of seconds for new data), so no connection is held open
+
+(function() {
+    if (!window.fetch) {
+        return;
+    }
+
+    var POLL_SECONDS = 30;
+    var generation = null;
+
+    function check() {
+        var url = '/generation' + (generation !== null ? '?since=' + encodeURIComponent(generation) : '');
+
+        fetch(url, {cache: 'no-store'})
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                if (generation !== null && data.generation !== generation) {
+                    var button = document.getElementById('data-refresh');
+                    if (button) {
+                        button.click();
+                    }
+                }
+                generation = data.generation;
+            })
+            .catch(function() {})
+            .then(function() { setTimeout(check, POLL_SECONDS * 1000); });
+    }
+
+    check();
+})();
@@ -0,0 +1,86 @@
+// Typed array figure data - decodes figure x, y & z arrays the server sends as base64 binary (typedarrays.py) into
+// typed arrays (dates into date strings) before plotly draws them.  Plotly is loaded on demand by dash, so its
+// drawing functions are wrapped when it arrives
+
+(function() {
+
+    var TYPES = {
+        'f8': Float64Array, 'f4': Float32Array, 'i4': Int32Array, 'u4': Uint32Array,
+        'i2': Int16Array, 'u2': Uint16Array, 'i1': Int8Array, 'u1': Uint8Array
+    };
+    var ENCODED_ARRAYS = ['x', 'y', 'z'];
+    var DAY_MS = 24 * 60 * 60 * 1000;
+
+    function decodeArray(value) {
+        if (!value || typeof value.bdata !== 'string' || !TYPES[value.dtype]) {
+            return value;
+        }
+
+        var binary = atob(value.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        var array = new TYPES[value.dtype](bytes.buffer);
+
+        if (value.dates === 'days') {
+            return Array.prototype.map.call(array, function(d) { return new Date(d * DAY_MS).toISOString().substring(0, 10); });
+        } else if (value.dates === 'ms') {
+            return Array.prototype.map.call(array, function(ms) { return new Date(ms).toISOString().substring(0, 23); });
+        }
+        return array;
+    }
+
+    // Copies of traces with their arrays decoded (dash keeps the figure it was sent)
+    function decodeData(data) {
+        if (!Array.isArray(data)) {
+            return data;
+        }
+        return data.map(function(trace) {
+            var decoded = Object.assign({}, trace);
+            ENCODED_ARRAYS.forEach(function(name) {
+                if (name in decoded) {
+                    decoded[name] = decodeArray(decoded[name]);
+                }
+            });
+            return decoded;
+        });
+    }
+
+    // Plotly.newPlot / react / plot take (div, data, layout, config) or (div, figure)
+    function wrap(plotly, name) {
+        var draw = plotly[name];
+        if (typeof draw !== 'function' || draw.decodesTypedArrays) {
+            return;
+        }
+
+        plotly[name] = function(gd, data) {
+            var args = Array.prototype.slice.call(arguments);
+            if (Array.isArray(data)) {
+                args[1] = decodeData(data);
+            } else if (data && data.data) {
+                args[1] = Object.assign({}, data, {data: decodeData(data.data)});
+            }
+            return draw.apply(this, args);
+        };
+        plotly[name].decodesTypedArrays = true;
+    }
+
+    function wrapPlotly(plotly) {
+        if (plotly) {
+            ['newPlot', 'react', 'plot'].forEach(function(name) { wrap(plotly, name); });
+        }
+        return plotly;
+    }
+
+    if (window.Plotly) {
+        wrapPlotly(window.Plotly);
+    } else {
+        var plotly;
+        Object.defineProperty(window, 'Plotly', {
+            configurable: true,
+            get: function() { return plotly; },
+            set: function(value) { plotly = wrapPlotly(value); }
+        });
+    }
+})();
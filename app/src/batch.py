@@ -24,9 +24,11 @@ import multiprocessing
 # Batch process to load data from API into dataframes and save to redis
 
 
-# Import our dataframes class
+# Import our dataframes class, aggregation kernels and geo helpers
 
-from dataframes import CasesData
+from dataframes import CasesData, DATA_CHANNEL
+import aggregates
+import geography
 
 # Contexts, & redis connections
 sc = SparkContext()
@@ -41,7 +43,10 @@ APIResponseType = Union[List[StructureType], str]
 
 # Mapping of API Hierarchy levels to app Hierachy levels
 LEVELS_DICT = {"nation" : "Nation", "region" : "Region", "utla" : "Upper tier local authority", 
-                "ltla" : "Lower tier local authority" } #, "nhsRegion" : "NHS Region" }
+                "ltla" : "Lower tier local authority", "msoa" : "Middle layer super output area" } #, "nhsRegion" : "NHS Region" }
+
+# Levels where the API only publishes 7 day rolling sums of cases (for week ending dates)
+WEEKLY_LEVELS = ["msoa"]
 
 #LEVELS_DICT = {"nation" : "Nation"} 
 
@@ -50,6 +55,12 @@ COLUMN_RENAMES = {"name" : "Area name", "code" : "Area code", "type" : "Area typ
 
 CASES_THRESHOLD = 250000    # Minimum number of cases to have loaded as a sanity check
 
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", multiprocessing.cpu_count()))   # Process pool size for weekly & summary stages
+INCREMENTAL_MAX_FRACTION = 0.25   # Rebuild everything if more than this fraction of areas have changed
+PUBLISHED_KEY = "Published.Cases"           # Hash of Cases.* partition key -> data timestamp it was published with
+PUBLISHED_OLD_KEY = "Published.Old.Cases"   # Same for the Old.Cases.* backups, checked by the incremental load
+BATCH_MEMORY_CHECK_MB = int(os.environ.get("BATCH_MEMORY_CHECK_MB", 0))    # Streaming mode fails without publishing if peak RSS went over this (0 = no check)
+
 EMPTY_DF = pd.DataFrame(columns=['Date','Area name','Area code','Area type','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test'])
 
 
@@ -125,7 +136,27 @@ def get_structure(level):
     if level == "nation":
         query_structure["Cases"] = "newCasesByPublishDate"
 
-    return query_structure     
+    # Neighbourhood level only has weekly case totals
+    if level in WEEKLY_LEVELS:
+        query_structure["Cases"] = "newCasesBySpecimenDateRollingSum"
+        for metric in ["Tests", "HospitalCases", "Deaths28"]:
+            del query_structure[metric]
+
+    return query_structure
+
+
+def spread_weekly_cases(df):
+    """ Spreads 7 day case totals (on week ending dates) evenly over the 7 days, so they can be treated as daily cases.
+        Remainders go to the latest days so weekly totals are unchanged """
+
+    weeks = np.repeat(np.arange(len(df)), 7)
+    days_before = np.tile(np.arange(6, -1, -1), len(df))
+
+    daily = df.iloc[weeks].copy()
+    daily.index = (daily.index - pd.to_timedelta(days_before, unit='D')).rename('Date')
+    daily['Cases'] = daily['Cases'] // 7 + (days_before < daily['Cases'] % 7)
+
+    return daily.sort_index()     
 
 
 def get_api_dataframe(level, month):
@@ -162,22 +193,33 @@ def get_api_dataframe(level, month):
         df['Date'] = pd.to_datetime(df['Date'],format="%Y-%m-%d")
         df.sort_values(by=['Date'], inplace=True)
         df.set_index('Date',inplace=True)
+        for col in ['Tests', 'Hospital Cases', 'Deaths within 28 Days of Positive Test']:
+            if col not in df.columns:
+                df[col] = 0
         df.fillna(0,inplace=True)
         df = df.astype({'Cases': int, 'Tests': int, 'Hospital Cases': int, 'Deaths within 28 Days of Positive Test': int})
 
+        if level in WEEKLY_LEVELS:
+            df = spread_weekly_cases(df)
+
         # Save dataframe to redis - note we create a new connection here so it can be serialised by Spark
         r = redis.Redis(host="localhost", port=6379, db=0)
         ac = pa.default_serialization_context()
 
-        # Save dataframe to redis - first backup previous data to "Old.xxx" key
+        # Save dataframe to redis - first backup previous data to "Old.xxx" key, moving its published stamp with it
         oldkey = "Old.Cases."+level+"."+month
         currentkey = "Cases."+level+"."+month
 
         if r.exists(oldkey):
             r.delete(oldkey)
-        
+        r.hdel(PUBLISHED_OLD_KEY, oldkey)
+
         if r.exists(currentkey):
+            published = r.hget(PUBLISHED_KEY, currentkey)
             r.rename(currentkey,oldkey)
+            r.hdel(PUBLISHED_KEY, currentkey)
+            if published:
+                r.hset(PUBLISHED_OLD_KEY, oldkey, published)
 
         # Save new data
         r.set(currentkey, ac.serialize(df).to_buffer().to_pybytes())
@@ -208,14 +250,9 @@ def load_weekly_cases(cases):
 
     print ("\nCreating weekly dataframe...\n")
 
-    tempdf = cases.dailydf.loc[(cases.dailydf.index > '2020-02-29')]
-    wdf = tempdf.groupby(['Area code','Area name','Area type'])['Cases'].resample('w').sum().reset_index()
-
-    wdf['Week'] = wdf['Date'].dt.strftime('%Y%U').astype("int")
-    wdf['Cases'] = wdf['Cases'].astype(int)
-
-    # Drop last incomplete week 
-    wdf = wdf.loc[(wdf['Week'] < wdf['Week'].max())]
+    start = time.time()
+    wdf = aggregates.weekly_stage(cases.dailydf, cases.levels, BATCH_WORKERS)
+    print(f"Weekly dataframe created in {time.time() - start:.2f} seconds ({BATCH_WORKERS} workers)")
 
     print(wdf.tail(5))
 
@@ -234,69 +271,17 @@ def load_summary_cases(cases):
 
     print ("\nCreating summary stats dataframe...\n")
 
-    # Calculate totals for last 4 weeks, last 2 weeks and preceding 2 weeks
-    
-    wdflast4 = cases.weeklydf.loc[(cases.weeklydf['Week'] > cases.weeklydf['Week'].max() - 4)]
-    wdflast2 = cases.weeklydf.loc[(cases.weeklydf['Week'] > cases.weeklydf['Week'].max() - 2)]
-    wdfprev2 = cases.weeklydf.loc[( (cases.weeklydf['Week'] > cases.weeklydf['Week'].max() - 4) & (cases.weeklydf['Week'] <= cases.weeklydf['Week'].max() - 2))]
-
-    # Summary stats for maps, tables
-
-    aggdf = cases.dailydf.groupby(['Area code','Area name','Area type']).agg({'Cases' : ['sum','mean','max']})
-    aggdf.columns = ['All Time Cases', 'Average Daily Cases', 'Peak Daily Cases']
-
-    # Add in population data
-    populationdf = get_population_df()
-    summarydf = populationdf.join(aggdf)
-
-    # Add in weekly summary totals
-    summarydf = summarydf.join(wdflast4.groupby(['Area code','Area name','Area type']).agg(**{'Last 4 Weeks Cases' : ('Cases','sum')}))
-    summarydf = summarydf.join(wdflast2.groupby(['Area code','Area name','Area type']).agg(**{'Cases in Last Fortnight' : ('Cases','sum')}))
-    summarydf = summarydf.join(wdfprev2.groupby(['Area code','Area name','Area type']).agg(**{'Cases in Previous Fortnight' : ('Cases','sum')}))
+    start = time.time()
+    summarydf = aggregates.summary_stage(cases.dailydf, cases.weeklydf, get_population_df(), cases.levels, BATCH_WORKERS)
+    print(f"Summary dataframe created in {time.time() - start:.2f} seconds ({BATCH_WORKERS} workers)")
 
-    # get a daily dataset for last 30 days
-    last30 = (datetime.datetime.strptime(cases.dailydf.index.max().strftime('%d/%m/%Y'), '%d/%m/%Y') - datetime.timedelta(days=31)).strftime(format='%Y-%m-%d')
-    
-    sdf = cases.dailydf.loc[cases.dailydf.index >= last30]
-    sdf.reset_index(inplace=True)
-
-    # pivot so we have a dataframe with dates as columns, then unpivot back into dataframe
-    spivot = sdf.pivot_table(index=['Area code','Area name','Area type'],columns='Date',values='Cases',aggfunc=np.sum)
-    unpivot = pd.DataFrame(spivot.to_records())
-    unpivot.set_index(['Area code','Area name','Area type'],inplace=True)
-
-    # Calculate slope & last 3, 7 day totals
-    unpivot['Last 14 Days Trend Slope'] = unpivot.apply(calc_slope, axis=1)
-    unpivot['Cases in Last 7 Days'] = unpivot.apply(calc_7, axis=1)
-
-    # Join it with our main summary dataframe
-    unpivot_join = unpivot[['Last 14 Days Trend Slope','Cases in Last 7 Days']]
-    summarydf = summarydf.join(unpivot_join)
-    #summarydf.info(verbose=True)
-
-    # Calculate ratios
-    summarydf['All Time Cases Per 1000 People'] = round(summarydf['All Time Cases']  / summarydf['Population'] * 1000,2)
-    summarydf['Last 4 Weeks Cases Per 1000 People'] = round(summarydf['Last 4 Weeks Cases']  / summarydf['Population'] * 1000,2)
-    summarydf['Fortnightly % Change'] = round((summarydf['Cases in Last Fortnight'] - summarydf['Cases in Previous Fortnight']) / summarydf['Cases in Previous Fortnight'] * 100,0)
-    summarydf['Average Daily Cases'] = round(summarydf['Average Daily Cases'],1)
-    summarydf['Last 7 Days Cases Per 1000 People'] = round(summarydf['Cases in Last 7 Days']  / summarydf['Population'] * 1000,2)
-    #summarydf.info(verbose=True)
-
-    # Fill NaN with 0, and force integers on cases columns (get converted to floats in merge)
-    summarydf=summarydf.fillna(0)
-    summarydf[['Population','All Time Cases','Peak Daily Cases','Last 4 Weeks Cases','Cases in Last Fortnight','Cases in Previous Fortnight']] = \
-        summarydf[['Population','All Time Cases','Peak Daily Cases','Last 4 Weeks Cases','Cases in Last Fortnight','Cases in Previous Fortnight']].astype(int)
-
-    # Reset index so we get normal area, name, type columns
-    summarydf.reset_index(inplace=True)
-    
-    #summarydf.info(verbose=True)
     print("Summary dataframe loaded.")
     print(summarydf.head(5))
     cases.summarydf = summarydf
 
     try:
         cases.redis_connection.set("CasesSummary", cases.arrow_context.serialize(cases.summarydf).to_buffer().to_pybytes())
+        save_daily_totals(cases, aggregates.calc_daily_totals(cases.dailydf))
     except redis.RedisError:
         print("Error updating redis CasesSummary")
         return False
@@ -304,18 +289,10 @@ def load_summary_cases(cases):
     return True
 
 
-def calc_slope(row):
-    """ Returns the slope of the preceding complete 14 days (we ignore last 2 days) of a dataframe row """
-
-    filled = row.fillna(0)
-    s = filled.rolling(window=7).mean().values
-    return np.polyfit(list(range(14)),s[-16:-2],1)[0].round(2)
+def save_daily_totals(cases, totalsdf):
+    ''' Saves per area daily totals with the published summary, for the incremental load to add new days to '''
 
-
-def calc_7(row):
-    """ sum of last 7 days """
-    s = row.fillna(0)
-    return int(sum(s[-7:]))
+    cases.redis_connection.set("CasesTotals", cases.arrow_context.serialize(totalsdf.reset_index()).to_buffer().to_pybytes())
 
 
 def get_population_df():
@@ -323,32 +300,27 @@ def get_population_df():
 
     popfile = os.path.dirname(__file__) + "/data/ukpopulation_rev.dat"
     popdf = pd.read_csv(popfile, index_col=[0,1,2],skiprows=0)
+
+    # Neighbourhood (MSOA) populations are kept in a separate file as there are ~7,000 of them
+    msoafile = os.path.dirname(__file__) + "/data/ukmsoapopulation.dat"
+    if os.path.exists(msoafile):
+        popdf = popdf.append(pd.read_csv(msoafile, index_col=[0,1,2],skiprows=0))
     popdf['Population'] = popdf['Population'].astype(int)
     print("Population dataframe loaded.")
     print(popdf.head(5))
     return popdf
 
 
-def failure_check(month_totals):
-    ''' Sanity checks monthly totals - returns True if checks fail '''
-
-    if np.isnan(month_totals).any():
-        print("NaN found in totals - failure detected")
-        return True
-    else:
-        totalcases = sum(month_totals)
-        print("Total:",totalcases)
-        
-        # Should have over 200k cases
-        if totalcases < CASES_THRESHOLD:
-            return True
+def failure_check(month_totals, level):
+    ''' Sanity checks monthly totals for a level - returns True if checks fail.  Weekly levels (rolling sums) aren't
+    published for the earliest months, so leading months with no data are skipped for them '''
 
-    return False
+    return aggregates.check_month_totals(month_totals, CASES_THRESHOLD, leading_empty=level in WEEKLY_LEVELS)
 
 
-def load_daily_cases(cases):
+def load_daily_cases(cases, reload=True):
     ''' Main data load function - calls API for each hierarchy level we need and saves data to Redis
-    to be picked up by the app '''
+    to be picked up by the app.  reload is unset in streaming mode so we don't build the full daily dataframe '''
 
     print("\nLoading daily cases data... "+"\n")
     
@@ -373,7 +345,7 @@ def load_daily_cases(cases):
         print(level,month_totals)
 
         # Sanity check data
-        failed = failure_check(month_totals)
+        failed = failure_check(month_totals, level)
         if failed:
             break
 
@@ -382,17 +354,152 @@ def load_daily_cases(cases):
         return False
     else:
         # Reload our saved redis data into daily dataframe
-        df = EMPTY_DF
-        df.set_index('Date',inplace=True)
+        if reload:
+            read_daily_cases(cases)
+        return True
 
-        for key in cases.redis_connection.keys(pattern='Cases.*'):
-            df = df.append(cases.arrow_context.deserialize(cases.redis_connection.get(key)))
-        
-        df = df.astype({'Cases': int, 'Tests': int, 'Hospital Cases': int, 'Deaths within 28 Days of Positive Test': int})
 
-        cases.dailydf = df.sort_index()
-        return True
+def read_daily_cases(cases):
+    ''' Reads saved monthly redis data into the daily dataframe '''
+
+    df = EMPTY_DF.set_index('Date')
+
+    for key in cases.redis_connection.keys(pattern='Cases.*'):
+        df = df.append(cases.arrow_context.deserialize(cases.redis_connection.get(key)))
+    
+    df = df.astype({'Cases': int, 'Tests': int, 'Hospital Cases': int, 'Deaths within 28 Days of Positive Test': int})
+
+    cases.dailydf = df.sort_index()
+
+
+
+def load_incremental_cases(cases):
+    ''' Recomputes weekly & summary rows only for areas whose daily cases were revised since the previous load
+        (new Cases.* partitions vs the Old.Cases.* backups), patching the published dataframes.  New days of data
+        just add newly completed weeks, and are added to the published daily totals (CasesTotals) the summary is
+        rebuilt from - with only the recent weeks & days of its reporting periods.
+        Returns False if a full rebuild is needed instead '''
+
+    print("\nChecking for changed areas...\n")
+
+    if not all(cases.redis_connection.exists(key) for key in ["CasesWeekly", "CasesSummary", "CasesTotals"]):
+        print("No published weekly / summary data. Full rebuild needed.")
+        return False
+
+    # Previous version of daily data from the backed up partitions
+    keys = cases.redis_connection.keys(pattern='Cases.*')
+    oldkeys = cases.redis_connection.keys(pattern='Old.Cases.*')
+    if len(oldkeys) != len(keys):
+        print("Previous partitions missing. Full rebuild needed.")
+        return False
+
+    # Backups must all be from the load the published weekly & summary data was built from (not a failed run since)
+    published = cases.redis_connection.get("data_timestamp")
+    if published is None or any(stamp != published for stamp in cases.redis_connection.hmget(PUBLISHED_OLD_KEY, oldkeys)):
+        print("Previous partitions aren't from the published load. Full rebuild needed.")
+        return False
+
+    previousdf = EMPTY_DF.set_index('Date')
+    for key in oldkeys:
+        previousdf = previousdf.append(cases.arrow_context.deserialize(cases.redis_connection.get(key)))
+    previousdf = previousdf.astype({'Cases': int})
+    previous_max = previousdf.index.max()
+
+    weeklydf = cases.arrow_context.deserialize(cases.redis_connection.get("CasesWeekly"))
+    summarydf = cases.arrow_context.deserialize(cases.redis_connection.get("CasesSummary"))
+    totalsdf = cases.arrow_context.deserialize(cases.redis_connection.get("CasesTotals")).set_index(aggregates.AREA_KEYS)
 
+    # Revisions to dates we had before (days after those are new data for every area, not revisions).  Each level is
+    # loaded from the API separately, so parent areas of revised areas show up in their own level's diff
+    changed = aggregates.calc_changed_areas(cases.dailydf.loc[cases.dailydf.index <= previous_max], previousdf)
+    print(f"{len(changed)} areas revised")
+
+    if len(changed) > INCREMENTAL_MAX_FRACTION * len(summarydf):
+        print("Too many changed areas. Full rebuild needed.")
+        return False
+
+    # A new latest date moves the reporting periods on, so every area's summary row changes
+    shifted = cases.dailydf.index.max() != previous_max
+
+    start = time.time()
+    if changed or shifted:
+        weeklydf, summarydf, totalsdf = aggregates.patch_weekly_summary(cases.dailydf, weeklydf, totalsdf, get_population_df(), changed, previous_max)
+
+    if not aggregates.check_consistency(cases.dailydf, weeklydf, summarydf, None if shifted else changed):
+        print("Consistency check failed. Full rebuild needed.")
+        return False
+
+    print(f"Weekly & summary dataframes patched in {time.time() - start:.2f} seconds")
+    cases.weeklydf, cases.summarydf = weeklydf, summarydf
+
+    try:
+        cases.redis_connection.set("CasesWeekly", cases.arrow_context.serialize(cases.weeklydf).to_buffer().to_pybytes())
+        cases.redis_connection.set("CasesSummary", cases.arrow_context.serialize(cases.summarydf).to_buffer().to_pybytes())
+        save_daily_totals(cases, totalsdf)
+    except redis.RedisError:
+        print("Error updating redis CasesWeekly / CasesSummary")
+        return False
+
+    return True
+
+
+def load_streaming_cases(cases):
+    ''' Streaming alternative to the daily reload, weekly & summary steps.  Folds saved month partitions
+        one at a time into running per area accumulators, so memory doesn't grow with full history.  Peak memory is
+        set by the largest partition, not bounded - BATCH_MEMORY_CHECK_MB is a post-run check that stops a run which
+        went over it from publishing, as a warning that history has outgrown the VM '''
+
+    print("\nStreaming month partitions into weekly & summary stats...\n")
+
+    # Month order, so the trailing daily window stays small
+    keys = sorted(cases.redis_connection.keys(pattern='Cases.*'), key=lambda k: k.decode().split('.')[-1])
+
+    accumulator = aggregates.CasesAccumulator()
+    for key in keys:
+        accumulator.add(cases.arrow_context.deserialize(cases.redis_connection.get(key)))
+
+        print(f"Folded {key.decode()} - Peak RSS {aggregates.peak_rss_mb():.0f} MB")
+
+    cases.weeklydf, cases.summarydf = accumulator.finalize(get_population_df())
+
+    peak = aggregates.peak_rss_mb()
+    if BATCH_MEMORY_CHECK_MB and peak > BATCH_MEMORY_CHECK_MB:
+        print(f"Peak RSS {peak:.0f} MB over the {BATCH_MEMORY_CHECK_MB} MB check. Not publishing.")
+        return False
+
+    print(cases.weeklydf.tail(5))
+    print(cases.summarydf.head(5))
+
+    try:
+        cases.redis_connection.set("CasesWeekly", cases.arrow_context.serialize(cases.weeklydf).to_buffer().to_pybytes())
+        cases.redis_connection.set("CasesSummary", cases.arrow_context.serialize(cases.summarydf).to_buffer().to_pybytes())
+        save_daily_totals(cases, accumulator.totals)
+    except redis.RedisError:
+        print("Error updating redis CasesWeekly / CasesSummary")
+        return False
+
+    return True
+
+
+def load_adjacency(cases):
+    ''' Builds area adjacency graphs (areas sharing a boundary edge) for each mapped level and saves them to redis '''
+
+    print("\nCreating area adjacency graphs...\n")
+
+    start = time.time()
+    adjacency = {level : geography.build_adjacency(cases.get_geodata(geo["file"]), geo["key"]) for level, geo in cases.geo_data.items()}
+
+    for level in adjacency:
+        print(level, len(adjacency[level]['codes']), "areas", len(adjacency[level]['neighbours']) // 2, "borders")
+    print(f"Adjacency graphs created in {time.time() - start:.2f} seconds")
+
+    try:
+        cases.redis_connection.set("AreaAdjacency", cases.arrow_context.serialize(adjacency).to_buffer().to_pybytes())
+    except redis.RedisError:
+        print("Error updating redis AreaAdjacency")
+        return False
+
+    return True
 
 
 def new_api_data_available(cases):
@@ -430,7 +537,16 @@ if __name__ == '__main__':
 
     cases = CasesData(batch=True)
 
-    if len(sys.argv) > 1:
+    if "--scaling" in sys.argv:
+        # Report weekly & summary stage scaling for 1..BATCH_WORKERS workers against the saved data
+        read_daily_cases(cases)
+        aggregates.report_scaling(cases.dailydf, get_population_df(), cases.levels, BATCH_WORKERS)
+        sys.exit()
+
+    # Command line options (--stream to use streaming aggregation, any other arg forces a reload)
+    streaming = "--stream" in sys.argv or os.environ.get("BATCH_STREAMING") == "1"
+
+    if [arg for arg in sys.argv[1:] if not arg.startswith("--")]:
         # Command line arg provided so override API date check
         print("Overriding API date check.")
         new_timestamp = datetime.datetime.now()
@@ -441,23 +557,33 @@ if __name__ == '__main__':
     if new_timestamp:
         print("API Data is newer, reloading.....")
 
-        # Load daily cases data        
-        if load_daily_cases(cases):
+        # Load daily cases data, then create weekly & summary stats dfs
+        if load_daily_cases(cases, reload=not streaming):
+
+            if streaming:
+                loaded = load_streaming_cases(cases)
+            else:
+                # Patch just the changed areas if we can, otherwise rebuild everything
+                loaded = load_incremental_cases(cases) or (load_weekly_cases(cases) and load_summary_cases(cases))
 
-            # Create weekly df
-            if load_weekly_cases(cases):
+            if loaded:
 
-                # Create summary stats df
-                if load_summary_cases(cases):
+                # Geo derived structures (failure here shouldn't stop the new data being published)
+                load_adjacency(cases)
 
-                    # Update timestamp on data - this will trigger the dashboard to reload data
-                    cases.redis_connection.set("data_timestamp", datetime.datetime.strftime(new_timestamp, '%Y-%m-%d %H:%M:%S') )
+                # Update timestamp on data (and stamp the partitions it was built from), and announce it so the dashboard workers reload
+                published = datetime.datetime.strftime(new_timestamp, '%Y-%m-%d %H:%M:%S')
+                pipe = cases.redis_connection.pipeline()
+                pipe.hset(PUBLISHED_KEY, mapping={key: published for key in cases.redis_connection.keys(pattern='Cases.*')})
+                pipe.set("data_timestamp", published)
+                pipe.execute()
+                cases.redis_connection.publish(DATA_CHANNEL, published)
 
-                    # Force redis disk write to flush previous changes
-                    cases.redis_connection.bgrewriteaof()
-                    
-                    print("\nBatch Complete.")
+                # Force redis disk write to flush previous changes
+                cases.redis_connection.bgrewriteaof()
+                
+                print(f"\nPeak RSS {aggregates.peak_rss_mb():.0f} MB")
+                print("\nBatch Complete.")
 
     else:
         print("No new data to load.")
-
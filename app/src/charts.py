@@ -6,9 +6,81 @@ import pandas as pd
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
+from typedarrays import encode_figure
+from rendercache import ResponseCache
 
 rowspacer = dbc.Row(style={'height': '1rem'})
 IGNORE_DAYS = -3
+FIGURE_CACHE_SIZE = 256     # Most finished chart figures we keep per worker
+CHART_WIDTH = 1200          # Typical full width chart (pixels) - line traces are downsampled to what it can show
+PIXELS_PER_POINT = 3
+LAYOUT_TEMPLATES = {}       # Chart figure layouts by chart type (see Chart.get_layout_template)
+CHART_PARAMS = ['plotlevel', 'plotareas', 'plotvars', 'plottitle', 'showtitle', 'plotdays', 'periodicity']
+
+# Daily data column each plot variable is drawn from (for charts rendered in the browser)
+SERIES_COLUMNS = {
+    'Cases' : 'Cases', 'Average' : 'Cases', 'Tests' : 'Tests',
+    'Hospital Cases' : 'Hospital Cases', 'Average Hospital Cases' : 'Hospital Cases',
+    'Deaths within 28 Days of Positive Test' : 'Deaths within 28 Days of Positive Test', 'Average Deaths' : 'Deaths within 28 Days of Positive Test'
+}
+PLOTDAYS_OPTIONS = [('Last 28 Days', 28), ('Last 90 Days', 90), ('All', 0)]
+
+
+figure_cache = ResponseCache(FIGURE_CACHE_SIZE)   # Finished chart figures (plotly json), keyed on plot parameters
+
+
+def lttb(x, y, threshold):
+    ''' Largest-Triangle-Three-Buckets downsampling.  Returns positions of the points to keep (threshold of them) from 
+        series x, y - the point making the largest triangle with its neighbouring buckets, so peaks & troughs are kept '''
+
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries for the points between the (always kept) first & last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    edges = np.append(edges, n)
+
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i+1]
+        nextx, nexty = x[end:edges[i+2]].mean(), y[end:edges[i+2]].mean()
+
+        area = np.abs((x[a] - nextx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (nexty - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i+1] = a
+
+    return keep
+
+
+
+def create_figure(secondary, weekly, showtitle, title=''):
+    ''' Returns trend chart plotly figure without traces - axes (with a secondary y axis if needed) and layout '''
+
+    fig = make_subplots(specs=[[{'secondary_y': True}]]) if secondary else make_subplots()
+    axes_defaults = {'showgrid' : True, 'gridwidth' : 1, 'gridcolor': '#E8E8E8', 'showline': True, 'linewidth': 1, 'linecolor': 'black'}
+
+    fig.update_xaxes(axes_defaults)
+    fig.update_yaxes(axes_defaults)
+
+    if weekly:
+        fig.update_yaxes(zeroline=True, zerolinecolor='black', zerolinewidth=1)
+
+    if secondary:
+        fig.update_yaxes(color='pink', rangemode='tozero', showgrid=False, secondary_y=True) 
+
+    if showtitle:
+        fig.update_layout( plot_bgcolor='white', title_text=title, title_x=0.01,legend=dict(orientation='h'),
+                        margin=dict(l=20, r=20, t=60, b=30), )
+    else:
+        fig.update_layout( plot_bgcolor='white', height=355, showlegend=False,margin=dict(l=0, r=0, t=0, b=0) )
+
+    return fig
+
+
 
 class Chart:
 
@@ -27,7 +99,15 @@ class Chart:
     def __init__(self, plotparams, cases):
 
         self.plotparams = plotparams
-        self.figure = self.create_trend_chart(cases)
+
+        # Repeat charts come from the figure cache (keyed on the parameters that affect the figure).
+        # Figure data is sent as typed arrays
+        key = tuple(str(plotparams[p]) for p in CHART_PARAMS)
+        self.figure = figure_cache.get(key, cases.latest_data_load_timestamp)
+
+        if self.figure is None:
+            self.figure = encode_figure(self.build_trend_figure(cases))
+            figure_cache.put(key, cases.latest_data_load_timestamp, self.figure)
 
 
     def get_plot_attributes(self, var, i):
@@ -47,14 +127,10 @@ class Chart:
             return dict(color=colours[i]), 1
 
 
-    def get_subplots(self):
-        ''' Create our initial plot figure with secondary axis if needed '''
+    def has_secondary_axis(self):
+        ''' Whether any plot variable is on a secondary y axis '''
 
-        for v in self.plotparams['plotvars'].split('|'):
-            if 'y2' in v.split(':'):
-                return make_subplots(specs=[[{'secondary_y': True}]])
-
-        return make_subplots()
+        return any('y2' in v.split(':') for v in self.plotparams['plotvars'].split('|'))
 
 
     def get_plot_name(self, area, var, plotvars):
@@ -86,22 +162,28 @@ class Chart:
         return yaxis, ptype
 
 
-    def create_trend_chart(self, cases):
-        ''' Function to create daily line chart for given plot parameters '''
+    def downsample(self, x, y):
+        ''' Returns x, y of a line trace downsampled to the points the chart width can show, keeping peaks and
+            the start of any gaps (missing values) so the line still breaks there '''
 
-        print('Creating trend chart...')
-        print(self.plotparams)
+        # Charts without titles are the small map card charts
+        maxpoints = (CHART_WIDTH if self.plotparams['showtitle'] else CHART_WIDTH // 2) // PIXELS_PER_POINT
+        if len(y) <= maxpoints:
+            return x, y
 
-        # Set up plot figure and axes 
+        values = y.values.astype(float)
+        valid = np.flatnonzero(~np.isnan(values))
+        gaps = np.flatnonzero(np.isnan(values[1:]) & ~np.isnan(values[:-1])) + 1
+
+        keep = valid[lttb(valid.astype(float), values[valid], maxpoints)]
+        keep = np.union1d(keep, gaps)
+
+        return x[keep], y.iloc[keep]
 
-        fig = self.get_subplots()
-        axes_defaults = {'showgrid' : True, 'gridwidth' : 1, 'gridcolor': '#E8E8E8', 'showline': True, 'linewidth': 1, 'linecolor': 'black'}
 
-        fig.update_xaxes(axes_defaults)
-        fig.update_yaxes(axes_defaults)
-    
-        if self.plotparams['periodicity'] == 'weekly':
-            fig.update_yaxes(zeroline=True, zerolinecolor='black', zerolinewidth=1)
+    def get_plot_data(self, cases):
+        ''' Yields (area number, area, plotting dataframe) for each plot area - the required level / periodicity data
+            with rolling averages, limited to the last n days if plotdays is set '''
 
         for i,area in enumerate(self.plotparams['plotareas'].split('|')):
 
@@ -109,14 +191,14 @@ class Chart:
 
             if self.plotparams['periodicity'] == 'weekly':
 
-                weekly = cases.weeklydf.loc[(cases.weeklydf['Area name'] == area) & (cases.weeklydf['Area type'] == self.plotparams['plotlevel']) ].groupby(['Area code','Area name','Area type','Date']).sum().reset_index()
+                weekly = cases.get_area_weekly(self.plotparams['plotlevel'], area).groupby(['Area code','Area name','Area type','Date'], observed=True).sum().reset_index()
                 weekly.set_index('Date',inplace=True)
                 change = weekly['Cases'] - weekly['Cases'].shift(1) 
                 iplotdf = pd.DataFrame(change,columns=['Cases'])
             
             else:
                 # Daily data
-                iplotdf = cases.dailydf.loc[(cases.dailydf['Area name'] == area) & (cases.dailydf['Area type'] == self.plotparams['plotlevel']) ]
+                iplotdf = cases.get_area_daily(self.plotparams['plotlevel'], area)
                 iplotdf = iplotdf.reindex(cases.date_index) 
 
                 # Create rolling averages
@@ -131,6 +213,36 @@ class Chart:
                 if self.plotparams['plotdays'] > 0:
                     iplotdf = iplotdf[self.plotparams['plotdays'] * -1:]
 
+            yield i, area, iplotdf
+
+
+    def get_title(self):
+        ''' Chart title depending on number of days, plot areas '''
+
+        title_suffix = ''
+        if self.plotparams['plotdays'] > 0:
+            title_suffix = ' - Last '+str(self.plotparams['plotdays'])+' Days'
+
+        plottitle = self.plotparams['plottitle'].split(':')  
+        if len(plottitle) > 1:
+            return plottitle[0] + ' - '+ self.plotparams['plotareas'].replace('|',', ')  + title_suffix
+        else:
+            return plottitle[0] + title_suffix
+
+
+    def create_trend_chart(self, cases):
+        ''' Function to create daily line chart for given plot parameters (plotly figure - build_trend_figure makes
+            the same figure json directly, and is what we serve) '''
+
+        print('Creating trend chart...')
+        print(self.plotparams)
+
+        # Set up plot figure and axes 
+
+        fig = create_figure(self.has_secondary_axis(), self.plotparams['periodicity'] == 'weekly', self.plotparams['showtitle'], self.get_title())
+
+        for i, area, iplotdf in self.get_plot_data(cases):
+
             plotvars = self.plotparams['plotvars'].split('|')
 
             for plotvar in plotvars:
@@ -141,14 +253,15 @@ class Chart:
                 style, opacity = self.get_plot_attributes(vars[0],i)
                 yaxis, ptype = self.get_plot_config(vars)
 
-                # Update secondary axis if we have one
+                # Update secondary axis titles if we have one
                 if yaxis == 'y2':
-                    fig.update_yaxes(title_text=vars[0],color='pink', rangemode='tozero', showgrid=False, secondary_y=True) 
+                    fig.update_yaxes(title_text=vars[0], secondary_y=True) 
                     fig.update_yaxes(title_text=plotvars[0], secondary_y=False)
 
                 if ptype == 'line':
+                    x, y = self.downsample(iplotdf.index, iplotdf[vars[0]])
                     fig.add_trace(
-                        go.Scatter( x=iplotdf.index, y=iplotdf[vars[0]], mode='lines', name=self.get_plot_name(area, vars[0], plotvars),
+                        go.Scatter( x=x, y=y, mode='lines', name=self.get_plot_name(area, vars[0], plotvars),
                                     opacity=opacity, line=style, yaxis=yaxis )
                     )
                 else:
@@ -157,24 +270,84 @@ class Chart:
                                 marker=dict(color=np.where(iplotdf[vars[0]] > 0, 'red', 'green').tolist()),  yaxis=yaxis ) 
                 )
 
-        # Modify chart title depending on number of days, plot areas  
-        title_suffix = ''
-        if self.plotparams['plotdays'] > 0:
-            title_suffix = ' - Last '+str(self.plotparams['plotdays'])+' Days'
+        return fig
 
-        plottitle = self.plotparams['plottitle'].split(':')  
-        if len(plottitle) > 1:
-            title = plottitle[0] + ' - '+ self.plotparams['plotareas'].replace('|',', ')  + title_suffix
-        else:
-            title = plottitle[0] + title_suffix
+
+    def get_layout_template(self):
+        ''' Returns figure layout json for this type of chart (secondary axis, periodicity, title) - made by plotly once
+            per type, and reused for every chart of the type '''
+
+        charttype = (self.has_secondary_axis(), self.plotparams['periodicity'] == 'weekly', self.plotparams['showtitle'])
+
+        if charttype not in LAYOUT_TEMPLATES:
+            LAYOUT_TEMPLATES[charttype] = create_figure(*charttype).to_plotly_json()['layout']
+
+        return LAYOUT_TEMPLATES[charttype]
+
+
+    def build_trend_figure(self, cases):
+        ''' Returns trend chart figure json (as create_trend_chart().to_plotly_json()) built directly from the plot data 
+            arrays and the chart type's layout template, without plotly's figure objects and property validation '''
+
+        print('Building trend chart...')
+
+        layout = dict(self.get_layout_template())
+        plotvars = self.plotparams['plotvars'].split('|')
+        data = []
+
+        for i, area, iplotdf in self.get_plot_data(cases):
+
+            for plotvar in plotvars:
+
+                vars = plotvar.split(':')
+                style, opacity = self.get_plot_attributes(vars[0],i)
+                yaxis, ptype = self.get_plot_config(vars)
+
+                if yaxis == 'y2':
+                    layout['yaxis'] = dict(layout['yaxis'], title={'text' : plotvars[0]})
+                    layout['yaxis2'] = dict(layout['yaxis2'], title={'text' : vars[0]})
+
+                trace = {'name' : self.get_plot_name(area, vars[0], plotvars), 'yaxis' : 'y2' if yaxis == 'y2' else 'y'}
+
+                if ptype == 'line':
+                    x, y = self.downsample(iplotdf.index, iplotdf[vars[0]])
+                    trace.update({'type' : 'scatter', 'mode' : 'lines', 'opacity' : opacity, 'line' : style,
+                                  'x' : x.to_pydatetime(), 'y' : y.values})
+                else:
+                    y = iplotdf[vars[0]].values
+                    trace.update({'type' : 'bar', 'marker' : {'color' : np.where(y > 0, 'red', 'green')},
+                                  'x' : iplotdf.index.to_pydatetime(), 'y' : y})
+
+                data.append(trace)
 
         if self.plotparams['showtitle']:
-            fig.update_layout( plot_bgcolor='white', title_text=title, title_x=0.01,legend=dict(orientation='h'),
-                            margin=dict(l=20, r=20, t=60, b=30), )
-        else:
-            fig.update_layout( plot_bgcolor='white', height=355, showlegend=False,margin=dict(l=0, r=0, t=0, b=0) )
+            layout['title'] = dict(layout['title'], text=self.get_title())
 
-        return fig
+        return {'data' : data, 'layout' : layout}
+
+
+
+class ChartSeries:
+    ''' Compact daily series for one area, for charts rendered in the browser (assets/charts.js draws the figures, 
+        with rolling averages and date windows) from the plot parameters and the raw daily values '''
+
+    def __init__(self, plotparams, cases):
+
+        self.plotparams = plotparams
+        self.data = self._get_series(cases)
+
+
+    def _get_series(self, cases):
+        ''' Returns series data - plot parameters, start date and daily values (None where missing) by column '''
+
+        areadf = cases.get_area_daily(self.plotparams['plotlevel'], self.plotparams['plotareas']).reindex(cases.date_index)
+        columns = sorted(set(SERIES_COLUMNS[v.split(':')[0]] for v in self.plotparams['plotvars'].split('|')))
+
+        return {
+            'plotparams' : {p : self.plotparams[p] for p in ['plotareas', 'plotvars', 'plottitle']},
+            'start' : cases.date_index[0].strftime('%Y-%m-%d') if len(cases.date_index) else None,
+            'values' : {c : areadf[c].astype(object).where(areadf[c].notna(), None).tolist() for c in columns}
+        }
 
 
 
@@ -192,12 +365,18 @@ class ChartLayout:
     def _get_layout(self):
         ''' Creates charts html layout '''
         
-        # Adhoc chart with dropdowns and empty charts - callback handles actual chart creation
+        # Adhoc chart with dropdowns and empty charts - callback fetches the area's series, and the browser draws the charts
         if self.plotparams['link'] == 'chart7':
             
             return html.Div(id='graphs',children=[
                 self._create_dropdowns_div(),
-                rowspacer,
+                dcc.Store(id='chart-series'),
+                dcc.RadioItems(
+                    id='plotdaysradio',
+                    options=[{'label': label, 'value': days} for label, days in PLOTDAYS_OPTIONS],
+                    value=self.plotparams['plotdays'] if self.plotparams['plotdays'] in [days for label, days in PLOTDAYS_OPTIONS] else 28,
+                    labelStyle={'display': 'inline-block', 'padding-right': '1rem', 'font-size': '80%'}
+                ),
                 dbc.Card(dcc.Graph(id='graph1', figure={})),
                 rowspacer,
                 dbc.Card(dcc.Graph(id='graph2', figure={}))
@@ -206,16 +385,13 @@ class ChartLayout:
         # 4 chart comparison - split plot areas into 4 separate charts
         elif self.plotparams['link'] == 'chart4':
 
+            # Parameters are copied for each chart, never changed - the caller keeps using them
             areas = self.plotparams['plotareas'].split('|')
             
-            self.plotparams['plotareas'] = areas[0]
-            fig1 = Chart(self.plotparams, self.cases)
-            self.plotparams['plotareas'] = areas[1]
-            fig2 = Chart(self.plotparams, self.cases)
-            self.plotparams['plotareas'] = areas[2]
-            fig3 = Chart(self.plotparams, self.cases)
-            self.plotparams['plotareas'] = areas[3]
-            fig4 = Chart(self.plotparams, self.cases)
+            fig1 = Chart(dict(self.plotparams, plotareas=areas[0]), self.cases)
+            fig2 = Chart(dict(self.plotparams, plotareas=areas[1]), self.cases)
+            fig3 = Chart(dict(self.plotparams, plotareas=areas[2]), self.cases)
+            fig4 = Chart(dict(self.plotparams, plotareas=areas[3]), self.cases)
         
             return html.Div(id='graphs',children=[
                 dbc.Row([
@@ -233,8 +409,7 @@ class ChartLayout:
         else:
             
             fig1 = Chart(self.plotparams, self.cases)
-            self.plotparams['plotdays'] = 0
-            fig2 = Chart(self.plotparams, self.cases)
+            fig2 = Chart(dict(self.plotparams, plotdays=0), self.cases)
             
             return html.Div(id='graphs',children=[
                 dbc.Card(dcc.Graph(id='graph1', figure=fig1.figure)),
@@ -275,12 +450,10 @@ class ChartLayout:
     def _create_area_dd_div (self):
         ''' Adhoc chart area dropdown selector '''
 
-        plotlist = self.cases.hierachy[self.plotparams['plotlevel']] 
-
         return html.Div([
             dcc.Dropdown(
                 id='plotareadd',
-                options=[{'label': i, 'value': i} for i in plotlist],
+                options=self.cases.get_area_options(self.plotparams['plotlevel'], value=self.plotparams['plotareas']),
                 value=self.plotparams['plotareas'],clearable=False
             )
         ])
@@ -297,3 +470,37 @@ class ChartLayout:
             )
         ])
 
+
+
+
+if __name__ == '__main__':
+
+    # Compare trend figure build times - built directly, and through plotly figure objects (the reference)
+    # Run this file for a 4 area all time chart from made up data
+
+    import timeit
+    from dataframes import CasesData, CasesSnapshot
+
+    dates = pd.date_range('2020-02-29', '2022-06-30')
+    areas = [('Region', 'Region ' + str(i), 'E1200000' + str(i)) for i in range(4)]
+    rng = np.random.default_rng(1)
+
+    dailydf = pd.concat([pd.DataFrame({'Date': dates, 'Area name': name, 'Area code': code, 'Area type': level,
+                                       'Cases': rng.integers(0, 500, len(dates)), 'Tests': rng.integers(0, 5000, len(dates)),
+                                       'Hospital Cases': rng.integers(0, 50, len(dates)), 'Deaths within 28 Days of Positive Test': rng.integers(0, 20, len(dates))})
+                         for level, name, code in areas]).set_index('Date').sort_index()
+    weeklydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Date': date, 'Cases': int(rng.integers(0, 3000))}
+                             for level, name, code in areas for date in pd.date_range('2020-03-01', '2022-06-26', freq='7D')])
+    summarydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for level, name, code in areas])
+
+    cases = CasesData(batch=True)
+    snapshot = CasesSnapshot(cases, dailydf, weeklydf, summarydf, data_timestamp='2020-10-01 12:00:00')
+
+    chart = Chart.__new__(Chart)
+    chart.plotparams = {'plotlevel': 'Region', 'plotareas': '|'.join(name for level, name, code in areas), 'plotvars': 'Average',
+                        'plottitle': '7 Day Average', 'plotdays': 0, 'showtitle': True, 'periodicity': 'daily'}
+
+    direct_time = timeit.timeit(lambda: chart.build_trend_figure(snapshot), number=20) / 20
+    plotly_time = timeit.timeit(lambda: chart.create_trend_chart(snapshot).to_plotly_json(), number=20) / 20
+
+    print(f'Trend chart build - direct {direct_time * 1000:6.2f} ms   plotly figure objects {plotly_time * 1000:6.2f} ms')
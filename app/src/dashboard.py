@@ -5,9 +5,16 @@ import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import plotly.graph_objects as go
 import plotly.express as px
+import threading
+from typedarrays import encode_figure
 
 rowspacer = dbc.Row(style={"height": "1rem"})
 
+# Summary fields carried in map customdata - just what the map click callback and map card need
+MAP_CUSTOMDATA = ['Area name','Area type','Population','All Time Cases','Peak Daily Cases']
+
+MAP_ZOOM = 5      # Initial map zoom (whole UK)
+
 class DashboardLayout:
     ''' Main application dashboard with dropdowns, map and daily/weekly trend chart layouts '''
 
@@ -29,7 +36,7 @@ class DashboardLayout:
             rowspacer, 
             dbc.Card(
                 dbc.Row([
-                    dbc.Col(dcc.Graph(id='map', figure={}, config={'displayModeBar': False}),width=6),
+                    dbc.Col([dcc.Graph(id='map', figure={}, config={'displayModeBar': False}), dcc.Store(id='map_resolution')],width=6),
                     dbc.Col(html.Div(id='table' ),width=6),
                 ],no_gutters=True)
             ), 
@@ -50,7 +57,7 @@ class DashboardLayout:
         return html.Div([
             dcc.Dropdown(
                 id='map_level_dd',
-                options=[{'label': "Map by "+i, 'value': i} for i in self.cases.levels[1:]],
+                options=[{'label': "Map by "+i, 'value': i} for i in self.cases.geo_data],
                 value=self.mapparams['plotlevel'],clearable=False
             )
         ])
@@ -79,30 +86,82 @@ class Map:
 
 
     def _create_map(self):
-        ''' Generate choropleth map for given plot level'''
+        ''' Generate choropleth map (plotly json) for given plot level'''
 
         mapdf = self.cases.summarydf.loc[(self.cases.summarydf['Area type'] == self.mapparams['plotlevel'])]
 
         f = go.Figure(go.Choroplethmapbox(
-            geojson=self.cases.geo_data[self.mapparams['plotlevel']]["data"],
+            geojson=self.cases.get_geo_url(self.mapparams['plotlevel'], self.mapparams.get('resolution')),
             locations=mapdf['Area code'], 
             z=mapdf[self.mapparams['plotmeasure']],
             featureidkey="properties." + self.cases.geo_data[self.mapparams['plotlevel']]["key"],
             colorscale=px.colors.sequential.YlGn, 
             text=mapdf['Area name'],
-            customdata=mapdf,
+            customdata=mapdf[MAP_CUSTOMDATA],
             colorbar=dict(thickness=10,ypad=0,xpad=0, x=0),
             marker_opacity=0.5, 
             marker_line_width=0)
         )
 
         f.update_layout(mapbox_style="carto-positron",autosize=True,clickmode="event", hovermode="closest", 
-                        mapbox_zoom=5, mapbox_center = {"lat": 53, "lon": -1.9},#height=468,
+                        mapbox_zoom=MAP_ZOOM, mapbox_center = {"lat": 53, "lon": -1.9}, uirevision="map",#height=468,
                         margin={"l":20,"t":20,"r":20,"b":20}, 
                         annotations=[dict(x=0.99,y=0.99,showarrow=False,text="Weekly metrics to "+self.cases.latest_complete_week),
                         dict(x=0.99,y=0.96,showarrow=False,text="Zoom / click on map area for detail")] )
 
-        return f
+        return f.to_plotly_json()
+
+
+
+class MapFigures:
+    ''' Prebuilt map figures for every map level and measure, rebuilt after each data load so map switches are a lookup.
+        Figures at the initial zoom's boundary resolution are prebuilt, others are built and kept when first zoomed to.
+        Figure data is kept typed array encoded, ready to send '''
+
+    def __init__(self):
+
+        self.figures = {}
+        self.generation = None
+        self.lock = threading.Lock()
+
+
+    def prebuild(self, cases):
+        ''' Builds figures for all levels and measures for the loaded data '''
+
+        if len(cases.summarydf) == 0:
+            return
+
+        figures = {}
+        for level in cases.geo_data:
+            resolution = cases.get_geo_resolution(level, MAP_ZOOM)
+            for measure in cases.map_measures:
+                figures[(level, measure, resolution)] = encode_figure(Map({'plotlevel' : level, 'plotmeasure' : measure, 'resolution' : resolution}, cases).figure)
+
+        # Swap in complete set
+        with self.lock:
+            self.figures = figures
+            self.generation = cases.latest_data_load_timestamp
+
+
+    def get(self, mapparams, cases):
+        ''' Returns prebuilt figure for map parameters (building it if we don't have it) '''
+
+        key = (mapparams['plotlevel'], mapparams['plotmeasure'], mapparams.get('resolution'))
+
+        # Figures are for one generation only (requests for other data, e.g. during a reload, get a figure built for them)
+        with self.lock:
+            figure = self.figures.get(key) if cases.latest_data_load_timestamp == self.generation else None
+
+        if figure is None:
+            figure = encode_figure(Map(mapparams, cases).figure)
+            with self.lock:
+                if cases.latest_data_load_timestamp == self.generation:
+                    self.figures[key] = figure
+
+        return figure
+
+
+map_figures = MapFigures()
 
 
 
@@ -135,7 +194,7 @@ class MapCardLayout:
                     dbc.Col(html.H5(self.plotparams['plotareas'],className='card-title'),width='auto'),
                     dbc.Col(html.A(html.Img(src='assets/line-chart-icon.jpg', height='20px'),href=chart_link),width='auto',className='pl-0')
                 ],justify='between'),
-                html.P('Population: '+str(self.cardfigs[3]) + ' - Total Cases: '+str(self.cardfigs[4]) + ' - Peak Daily Cases: '+str(self.cardfigs[6]) ,style={'font-size':'80%'}),
+                html.P('Population: '+str(self.cardfigs['Population']) + ' - Total Cases: '+str(self.cardfigs['All Time Cases']) + ' - Peak Daily Cases: '+str(self.cardfigs['Peak Daily Cases']) ,style={'font-size':'80%'}),
                 dcc.Graph(figure=self.chart,config={'displayModeBar': False})
             ]
         ,style={'padding-top': '15px','padding-right': '15px','padding-bottom': '5px'})
\ No newline at end of file
@@ -3,13 +3,34 @@ import datetime
 import time
 import json
 import os
+import hashlib
+import fcntl
+import shutil
+import threading
+import numpy as np
 import pyarrow as pa
 import redis
 
+from geography import AreaGraph, AreaLocator, GEO_RESOLUTIONS, simplified_filename
+
+MAX_DROPDOWN_OPTIONS = 500     # Most areas we list in a dropdown, larger levels need a search
+
+# Directory for memory mapped data files shared by all gunicorn workers (unset to load from redis into each worker)
+MMAP_DIR = os.environ.get("CASES_MMAP_DIR")
+MMAP_FRAMES = ['daily', 'weekly', 'summary']
+MMAP_AREA_FRAMES = ['daily', 'weekly']     # Frames with a row per area & date - text columns dictionary encoded, area row index shared
+
+DATA_CHANNEL = "data_generation"    # Redis pub/sub channel the batch announces each new data load on
+SUBSCRIBE_RETRY_SECONDS = 10
+RELOAD_RETRY_SECONDS = 60       # Wait before trying a failed data load again
+
 
 class CasesData:
     ''' Main Cases class that holds all our case and reference data frames and hierachies 
-        batch parameter is set if we are running our batch etl process outside docker container - hence different redis host '''
+        batch parameter is set if we are running our batch etl process outside docker container - hence different redis host.
+
+        Shared by all of a worker's request threads: loaded data lives in immutable snapshots, swapped in by reference,
+        and nothing changes a snapshot's frames once built (callers copy before changing anything) '''
 
     def __init__(self, batch=None):
         
@@ -25,7 +46,7 @@ class CasesData:
         self.arrow_context = pa.default_serialization_context()
 
         # Static lists
-        self.levels = ['Nation','Region','Upper tier local authority','Lower tier local authority']
+        self.levels = ['Nation','Region','Upper tier local authority','Lower tier local authority','Middle layer super output area']
 
         self.map_measures = ["Last 4 Weeks Cases Per 1000 People", "Fortnightly % Change", 
                                 "All Time Cases Per 1000 People", "Last 14 Days Trend Slope",
@@ -42,88 +63,254 @@ class CasesData:
             'Average Deaths': [self.levels[0]]
         }
 
-        # Static Geo mapping data
+        # Static Geo mapping data (neighbourhood boundaries are optional, only mapped if the file is present).
+        # Boundaries are only parsed here for point lookups, maps load them from static urls
 
-        self.geo_data = {
-            self.levels[1] : { "key" : "rgn19cd" , "data" : self.get_geodata("ukregionsgeo.json") },
-            self.levels[2] : { "key" : "ctyua17cd" , "data" : self.get_geodata("ukcountygeo.json") },
-            self.levels[3] : { "key" : "lad19cd" , "data" : self.get_geodata("uklocalauthgeo.json") }
+        geo_files = {
+            self.levels[1] : { "key" : "rgn19cd" , "file" : "ukregionsgeo.json" },
+            self.levels[2] : { "key" : "ctyua17cd" , "file" : "ukcountygeo.json" },
+            self.levels[3] : { "key" : "lad19cd" , "file" : "uklocalauthgeo.json" },
+            self.levels[4] : { "key" : "msoa11cd" , "file" : "ukmsoageo.json" }
         }
 
-        # Empty dataframes & variables.
+        self.geo_data = { level : { "key" : geo["key"], "file" : geo["file"] }
+                            for level, geo in geo_files.items() if os.path.exists(os.path.dirname(__file__) + "/data/" + geo["file"]) }
 
-        self.dailydf=pd.DataFrame(columns=['Date','Area name','Area code','Area type','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test'])
-        self.dailydf.set_index('Date',inplace=True)
-        self.weeklydf=pd.DataFrame(columns=['Area code','Area name','Area type','Date','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test','Week'])
-        self.summarydf=pd.DataFrame(columns=['Area code','Area name','Area type','Population','Last 4 Weeks Cases Per 1000 People','Fortnightly % Change','Last 7 Days Cases Per 1000 People','Last 3 Days Cases Per 1000 People'])
+        # Boundary files for maps - simplified by resolution (generated by geography.py, used where present).
+        # Maps load these by url, fingerprinted with the file contents so browsers & nginx can cache them indefinitely
+        self.geo_urls = {}
+        for level, geo in self.geo_data.items():
+            geo["resolutions"] = { resolution : simplified_filename(geo["file"], resolution) for resolution in GEO_RESOLUTIONS
+                                    if os.path.exists(os.path.dirname(__file__) + "/data/" + simplified_filename(geo["file"], resolution)) }
+            for filename in [geo["file"]] + list(geo["resolutions"].values()):
+                self.geo_urls[filename] = "/geo/" + filename.replace(".json", "." + self.get_fingerprint(filename) + ".json")
 
-        self.latest_case_date = ""
-        self.latest_complete_week = ""
-        self.latest_data_load_timestamp = None
-        self.arealist = []
-        self.hierachy = {}
+        self.geo_files = { url.split("/")[-1] : filename for filename, url in self.geo_urls.items() }
+
+        # Empty dataframes & variables, in an initial (empty) data snapshot.  Each data load builds a new snapshot and 
+        # swaps it in whole.  Data attributes read from this object come from the current snapshot
+
+        dailydf=pd.DataFrame(columns=['Date','Area name','Area code','Area type','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test'])
+        dailydf.set_index('Date',inplace=True)
+        weeklydf=pd.DataFrame(columns=['Area code','Area name','Area type','Date','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test','Week'])
+        summarydf=pd.DataFrame(columns=['Area code','Area name','Area type','Population','Last 4 Weeks Cases Per 1000 People','Fortnightly % Change','Last 7 Days Cases Per 1000 People','Last 3 Days Cases Per 1000 People'])
+
+        self.snapshot = CasesSnapshot(self, dailydf, weeklydf, summarydf)
+        self._reload_lock = threading.Lock()
+        self._loaded = threading.Condition()
+        self._locator = None
+        self._locator_lock = threading.Lock()
 
-        # Load saved dataframes
-        self.load()
+        # Functions called with each new snapshot before it's published (e.g. to prebuild figures)
+        self.load_listeners = []
 
+        # Load saved dataframes (not needed by the batch, which builds its own, and would hold full history in memory)
+        # then reload whenever the batch announces new data
+        if not batch:
+            self.load(wait=True)
+            self.subscribe()
 
-    def load(self):
-        ''' Method to load cases data from Redis into daily, weekly and summary dataframes. 
-            Called from app serve layout function '''
+
+    def load(self, wait=False):
+        ''' Method to load new cases data from Redis, if there is any.  Called from app serve layout & refresh callbacks.
+            Data is loaded on a background thread into a new snapshot, so requests carry on using the current one 
+            until it's swapped in (wait is set to load synchronously, e.g. on startup) '''
 
         # Check if we have new data by checking timestamp of saved cases in redis
         data_timestamp = self.get_cases_timestamp()
 
-        print("\nWeb App Data last refreshed",self.latest_data_load_timestamp)
+        print("\nWeb App Data last refreshed",self.snapshot.latest_data_load_timestamp)
         print("Redis data timestamp",data_timestamp)
 
-        if self.latest_data_load_timestamp != data_timestamp:
-            
-            print("Redis data updated, Loading new data.....")
+        if self.snapshot.latest_data_load_timestamp != data_timestamp:
 
-            # Make sure we have redis data
-            if self.redis_connection.exists("CasesSummary"):
+            # One reload at a time - later callers keep the current snapshot until it's done (when it checks again for
+            # anything newer)
+            if not self._reload_lock.acquire(blocking=False):
+                print("Data reload already in progress")
+                return
 
-                # Set timestamp so we don't load it again until the next batch refresh
-                self.latest_data_load_timestamp = data_timestamp
+            reload = threading.Thread(target=self._reload, args=(data_timestamp,), daemon=True)
+            reload.start()
+            if wait:
+                reload.join()
 
-                # Load Daily data from redis keys
 
-                print("Loading cases data from redis")
-                self.dailydf=pd.DataFrame(columns=['Date','Area name','Area code','Area type','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test'])
-                for key in self.redis_connection.keys(pattern='Cases.*'):
-                    self.dailydf = self.dailydf.append(self.arrow_context.deserialize(self.redis_connection.get(key)))
-                self.dailydf = self.dailydf.astype({'Cases': int, 'Tests': int, 'Hospital Cases': int, 'Deaths within 28 Days of Positive Test': int})
-                self.dailydf.sort_index(inplace=True)
-                
-                self.latest_case_date = self.dailydf.index.max().strftime('%d/%m/%Y')
-                self.date_index = pd.date_range('2020-02-29', self.dailydf.index.max())
+    def subscribe(self):
+        ''' Starts thread listening for the batch's new data announcements, loading the new data when one arrives '''
 
-                # Area lists & hierachy
-                self.arealist = sorted(self.dailydf['Area name'].unique())
+        threading.Thread(target=self._listen, daemon=True).start()
 
-                for level in self.levels:
-                    self.hierachy.update({level : sorted(self.dailydf.loc[self.dailydf['Area type'] == level]['Area name'].unique())})
 
-                # Weekly data
-                self.weeklydf = self.arrow_context.deserialize(self.redis_connection.get("CasesWeekly"))
+    def _listen(self):
+        ''' Subscription loop, resubscribing (and catching up on any data we missed) if redis goes away '''
 
-                day = int(self.weeklydf['Date'].max().strftime("%d"))
-                if 4 <= day <= 20 or 24 <= day <= 30:
-                    suffix = "th"
-                else:
-                    suffix = ["st", "nd", "rd"][day % 10 - 1]
+        while True:
+            try:
+                pubsub = self.redis_connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(DATA_CHANNEL)
+                self.load()
 
-                self.latest_complete_week = str(day) + suffix + " " +self.weeklydf['Date'].max().strftime("%b")
+                for message in pubsub.listen():
+                    print("New data announced", message["data"])
+                    self.load()
 
-                # Summary stats
-                self.summarydf = self.arrow_context.deserialize(self.redis_connection.get("CasesSummary"))
+            except redis.ConnectionError:
+                print("Redis subscription lost.  Retrying.")
+                time.sleep(SUBSCRIBE_RETRY_SECONDS)
 
-                print ("LATEST CASES",self.latest_case_date)
-                print ("LATEST COMPLETE WEEK",self.latest_complete_week)
 
-            else:
+    def wait_for_load(self, timeout):
+        ''' Waits until a new data snapshot is published, or timeout (seconds) '''
+
+        with self._loaded:
+            self._loaded.wait(timeout)
+
+
+    def __getattr__(self, name):
+        ''' Data attributes & methods come from the current snapshot.  Code that reads several should take 
+            the snapshot once instead, so it can't see a mix of old and new data '''
+
+        if "snapshot" not in self.__dict__:
+            raise AttributeError(name)
+
+        return getattr(self.__dict__["snapshot"], name)
+
+
+    def _reload(self, data_timestamp):
+        ''' Loads cases data for data timestamp into a new snapshot, then publishes it.  Afterwards we check again for
+            data announced while we were loading, or if loading failed try again later '''
+
+        loaded = False
+        try:
+            # Make sure we have redis data
+            if not self.redis_connection.exists("CasesSummary"):
                 print("CasesDaily not found in Redis cache.  No data!!!!.")
+                return
+
+            print("Redis data updated, Loading new data.....")
+
+            # Load daily, weekly & summary data
+
+            area_rows = None
+            if MMAP_DIR:
+                (dailydf, weeklydf, summarydf), area_rows = self._map_frames(data_timestamp)
+            else:
+                dailydf, weeklydf, summarydf = self._read_frames()
+
+            # Area adjacency graphs (precomputed by batch from geo data) for hotspot clusters
+            adjacency = {}
+            if self.redis_connection.exists("AreaAdjacency"):
+                adjacency = self.arrow_context.deserialize(self.redis_connection.get("AreaAdjacency"))
+
+            snapshot = CasesSnapshot(self, dailydf, weeklydf, summarydf, adjacency, data_timestamp, area_rows)
+
+            print ("LATEST CASES",snapshot.latest_case_date)
+            print ("LATEST COMPLETE WEEK",snapshot.latest_complete_week)
+
+            for listener in self.load_listeners:
+                listener(snapshot)
+
+            # Publish with a single reference swap - readers see the whole old or whole new generation, never a mix
+            self.snapshot = snapshot
+
+            with self._loaded:
+                self._loaded.notify_all()
+            loaded = True
+
+        except Exception as e:
+            print("Data load failed", repr(e))
+
+        finally:
+            self._reload_lock.release()
+
+        if not loaded:
+            retry = threading.Timer(RELOAD_RETRY_SECONDS, self.load)
+            retry.daemon = True
+            retry.start()
+        elif self.get_cases_timestamp() != data_timestamp:
+            self.load()
+
+
+    def _read_frames(self):
+        ''' Returns daily, weekly & summary dataframes read from redis '''
+
+        print("Loading cases data from redis")
+
+        dailydf=pd.DataFrame(columns=['Date','Area name','Area code','Area type','Cases','Tests','Hospital Cases','Deaths within 28 Days of Positive Test'])
+        for key in self.redis_connection.keys(pattern='Cases.*'):
+            dailydf = dailydf.append(self.arrow_context.deserialize(self.redis_connection.get(key)))
+        dailydf = dailydf.astype({'Cases': int, 'Tests': int, 'Hospital Cases': int, 'Deaths within 28 Days of Positive Test': int})
+        dailydf.sort_index(inplace=True)
+
+        weeklydf = self.arrow_context.deserialize(self.redis_connection.get("CasesWeekly"))
+        summarydf = self.arrow_context.deserialize(self.redis_connection.get("CasesSummary"))
+
+        return dailydf, weeklydf, summarydf
+
+
+    def _map_frames(self, data_timestamp):
+        ''' Returns daily, weekly & summary dataframes backed by memory mapped arrow files, so workers share the pages,
+            and the daily & weekly area row indexes (also mapped).  The first worker to see a new data timestamp writes
+            the files from redis, the others wait for it and map them '''
+
+        generation = os.path.join(MMAP_DIR, str(data_timestamp).replace(" ", "T").replace(":", ""))
+        os.makedirs(MMAP_DIR, exist_ok=True)
+
+        with open(os.path.join(MMAP_DIR, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if not os.path.exists(generation):
+                print("Writing memory mapped cases data", generation)
+
+                newdir = generation + ".new"
+                shutil.rmtree(newdir, ignore_errors=True)
+                os.makedirs(newdir)
+
+                write_mapped_frames(newdir, self._read_frames())
+                os.rename(newdir, generation)
+
+                # Remove previous generations (workers still using them keep their mappings until they reload)
+                for entry in os.listdir(MMAP_DIR):
+                    if entry not in (".lock", os.path.basename(generation)):
+                        shutil.rmtree(os.path.join(MMAP_DIR, entry), ignore_errors=True)
+
+        print("Mapping cases data", generation)
+
+        return read_mapped_frames(generation)
+
+
+    @property
+    def locator(self):
+        ''' Spatial index of geo data for point to area lookups - built on first use so it doesn't slow worker startup '''
+
+        with self._locator_lock:
+            if self._locator is None:
+                self._locator = AreaLocator({ level : { "key" : geo["key"], "data" : self.get_geodata(geo["file"]) } for level, geo in self.geo_data.items() })
+        return self._locator
+
+
+    def get_geo_resolution(self, level, zoom):
+        ''' Returns coarsest simplified boundary resolution for level that's still finer than a map pixel at zoom
+            (None if only the original boundaries are detailed enough) '''
+
+        pixel = 360 / (512 * 2 ** zoom)
+        resolutions = sorted(self.geo_data[level]["resolutions"], key=lambda r: GEO_RESOLUTIONS[r]["tolerance"], reverse=True)
+
+        return next((r for r in resolutions if GEO_RESOLUTIONS[r]["tolerance"] <= pixel), None)
+
+
+    def get_geo_url(self, level, resolution=None):
+        ''' Returns url of boundary geojson for level at given resolution (original boundaries if None) '''
+
+        return self.geo_urls[self.geo_data[level]["resolutions"].get(resolution, self.geo_data[level]["file"])]
+
+
+    def get_fingerprint(self, filename):
+        ''' Returns short hash of data file contents, for cache busting urls '''
+
+        with open(os.path.dirname(__file__) + "/data/" + filename, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()[:12]
 
 
     def get_geodata(self, filename):
@@ -147,14 +334,183 @@ class CasesData:
             return datetime.datetime(1970, 1, 1, 12, 00, 00)
 
 
-    def get_plot_level(self, areaname):
-        ''' Method to find a hierachy level for a given area (lower tier authorities have priority) '''
-
-        if areaname in self.hierachy[self.levels[3]]:
-            return self.levels[3]
-        elif areaname in self.hierachy[self.levels[2]]:
-            return self.levels[2]
-        elif areaname in self.hierachy[self.levels[1]]:
-            return self.levels[1]
+
+def get_area_rows(df):
+    ''' Returns row positions of each area's data in a dataframe, as {(area type, area name) : positions} '''
+
+    return df.groupby(['Area type','Area name'], observed=True).indices
+
+
+def write_mapped_frames(directory, frames):
+    ''' Writes daily, weekly & summary dataframes as arrow files for memory mapping.  In the daily & weekly files text
+        columns are dictionary encoded (with indices the width pandas uses for categorical codes, so they map without a
+        copy), and their area row indexes are written alongside - all per row data is numeric and shared by workers '''
+
+    for name, df in zip(MMAP_FRAMES, frames):
+        table = pa.Table.from_pandas(df).combine_chunks()
+
+        if name in MMAP_AREA_FRAMES:
+            for i, field in enumerate(table.schema):
+                if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+                    encoded = table.column(i).dictionary_encode().chunk(0)
+                    width = pa.int8() if len(encoded.dictionary) < 2**7 else pa.int16() if len(encoded.dictionary) < 2**15 else pa.int32()
+                    table = table.set_column(i, field.name, pa.DictionaryArray.from_arrays(encoded.indices.cast(width), encoded.dictionary))
+
+            # Row positions of each area, in one array, and each area's end position in it
+            rows = get_area_rows(df)
+            positions = np.concatenate(list(rows.values())) if rows else np.zeros(0)
+            np.save(os.path.join(directory, name + ".rows.npy"), positions.astype(np.int32))
+            write_arrow(os.path.join(directory, name + ".areas.arrow"), pa.table({
+                'Area type' : [level for level, area in rows], 'Area name' : [area for level, area in rows],
+                'End' : np.cumsum([len(positions) for positions in rows.values()], dtype=np.int64)}))
+
+        write_arrow(os.path.join(directory, name + ".arrow"), table)
+
+
+def write_arrow(filename, table):
+    ''' Writes table as an arrow IPC file '''
+
+    with pa.OSFile(filename, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_mapped_frames(directory):
+    ''' Returns (daily, weekly & summary dataframes, daily & weekly area row indexes) memory mapped from the files
+        written by write_mapped_frames.  Numeric, date & dictionary encoded text columns are used in place (read only) '''
+
+    frames = tuple(pa.ipc.open_file(pa.memory_map(os.path.join(directory, name + ".arrow"))).read_all().to_pandas(split_blocks=True)
+                   for name in MMAP_FRAMES)
+
+    area_rows = []
+    for name in MMAP_AREA_FRAMES:
+        positions = np.load(os.path.join(directory, name + ".rows.npy"), mmap_mode='r')
+        areas = pa.ipc.open_file(pa.memory_map(os.path.join(directory, name + ".areas.arrow"))).read_all().to_pydict()
+        starts = [0] + areas['End'][:-1]
+        area_rows.append({(level, area) : positions[start:end] for level, area, start, end in zip(areas['Area type'], areas['Area name'], starts, areas['End'])})
+
+    return frames, tuple(area_rows)
+
+
+
+class CasesSnapshot:
+    ''' One generation of loaded cases data, with the area lookups built from it.  Not changed once built - a new 
+        snapshot is built for each data load.  Static reference data (levels, measures, geo data) is read from cases '''
+
+    def __init__(self, cases, dailydf, weeklydf, summarydf, adjacency=None, data_timestamp=None, area_rows=None):
+
+        self._cases = cases
+
+        self.dailydf = dailydf
+        self.weeklydf = weeklydf
+        self.summarydf = summarydf
+        self.latest_data_load_timestamp = data_timestamp
+
+        self.latest_case_date = ""
+        self.latest_complete_week = ""
+        self.date_index = pd.DatetimeIndex([])
+        self.arealist = []
+        self.hierachy = {}
+        self.hierachy_sets = {}
+        self.area_options = {}
+        self.daily_rows = {}
+        self.weekly_rows = {}
+        self.area_names = {}
+        self.adjacency = {level : AreaGraph(adjacency[level]) for level in (adjacency or {})}
+
+        if len(summarydf) == 0:
+            return
+
+        self.latest_case_date = self.dailydf.index.max().strftime('%d/%m/%Y')
+        self.date_index = pd.date_range('2020-02-29', self.dailydf.index.max())
+
+        # Row positions of each area's data, so we can slice out an area without scanning the whole dataframe
+        # (given if they were built once for all workers, see read_mapped_frames)
+        self.daily_rows, self.weekly_rows = area_rows or (get_area_rows(self.dailydf), get_area_rows(self.weeklydf))
+
+        # Area lists & hierachy
+        self.arealist = sorted(set(name for level, name in self.daily_rows))
+
+        for level in cases.levels:
+            self.hierachy.update({level : sorted(name for arealevel, name in self.daily_rows if arealevel == level)})
+            self.hierachy_sets.update({level : set(self.hierachy[level])})
+            self.area_options.update({level : [{'label': i, 'value': i} for i in self.hierachy[level]]})
+
+        # Weekly data
+        day = int(self.weeklydf['Date'].max().strftime("%d"))
+        if 4 <= day <= 20 or 24 <= day <= 30:
+            suffix = "th"
         else:
-            return self.levels[0]
+            suffix = ["st", "nd", "rd"][day % 10 - 1]
+
+        self.latest_complete_week = str(day) + suffix + " " +self.weeklydf['Date'].max().strftime("%b")
+
+        # Area names by level & area code (for point to area lookups)
+        self.area_names = dict(zip(zip(self.summarydf['Area type'], self.summarydf['Area code']), self.summarydf['Area name']))
+
+
+    def __getattr__(self, name):
+        ''' Static reference data & geo lookups come from the cases object '''
+
+        if "_cases" not in self.__dict__:
+            raise AttributeError(name)
+
+        return object.__getattribute__(self.__dict__["_cases"], name)
+
+
+    def get_area_levels(self):
+        ''' Returns levels in the order areas are looked up - lower tier authorities first, then upper tier authorities
+            and regions, with MSOAs only as a fallback (most chart & find links are for local authorities) '''
+
+        return [self.levels[3], self.levels[2], self.levels[1], self.levels[4]]
+
+
+    def get_plot_level(self, areaname):
+        ''' Method to find a hierachy level for a given area (see get_area_levels), or the nation '''
+
+        for level in self.get_area_levels():
+            if areaname in self.hierachy_sets.get(level, ()):
+                return level
+
+        return self.levels[0]
+
+
+    def get_area_daily(self, level, areaname):
+        ''' Returns daily data for an area '''
+
+        return self.dailydf.iloc[self.daily_rows.get((level, areaname), [])]
+
+
+    def get_area_weekly(self, level, areaname):
+        ''' Returns weekly data for an area '''
+
+        return self.weeklydf.iloc[self.weekly_rows.get((level, areaname), [])]
+
+
+    def get_area_options(self, level, search=None, value=None):
+        ''' Returns dropdown options for areas at a level.  Levels with too many areas to list are limited to
+            (case insensitive) matches of the search text, plus the current value '''
+
+        options = self.area_options.get(level, [])
+        if len(options) <= MAX_DROPDOWN_OPTIONS:
+            return options
+
+        search = (search or '').lower()
+        matches = [o for o in options if search in o['label'].lower()][:MAX_DROPDOWN_OPTIONS] if search else []
+
+        if value in self.hierachy_sets[level] and value not in [o['value'] for o in matches]:
+            matches.insert(0, {'label': value, 'value': value})
+
+        return matches
+
+
+    def find_area(self, lat, lon):
+        ''' Returns (level, area name) of the area containing a point, levels in get_area_levels order, or None '''
+
+        found = self.locator.locate(lat, lon)
+
+        for level in self.get_area_levels():
+            if level in found and (level, found[level]) in self.area_names:
+                return level, self.area_names[(level, found[level])]
+
+        return None
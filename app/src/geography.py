@@ -0,0 +1,333 @@
+''' Geographic structures precomputed from the boundary geojson - area adjacency graph, hotspot clusters,
+    spatial index for point to area lookups, and simplified (lower resolution) boundaries for maps.
+
+    Run as a script to regenerate the simplified geojson files:  python geography.py '''
+
+import itertools
+import math
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+COORD_PRECISION = 5     # Decimal places used to match boundary vertices shared by neighbouring areas (~1m)
+GRID_SIZE = 0.1         # Spatial index grid cell size (degrees)
+EDGE_BANDS = 32         # Horizontal bands per polygon, so point in polygon tests only check edges near the point
+
+# Simplified boundary resolutions - simplification tolerance and coordinate decimal places (degrees)
+GEO_RESOLUTIONS = {
+    'high' : { 'tolerance' : 0.002, 'precision' : 4 },
+    'medium' : { 'tolerance' : 0.008, 'precision' : 3 },
+    'low' : { 'tolerance' : 0.02, 'precision' : 3 },
+}
+
+GEO_FILES = {"ukregionsgeo.json" : "rgn19cd", "ukcountygeo.json" : "ctyua17cd", "uklocalauthgeo.json" : "lad19cd", "ukmsoageo.json" : "msoa11cd"}
+GEO_DIR = os.path.dirname(__file__) + "/data/"
+
+
+def polygon_rings(geometry):
+    ''' Returns list of coordinate rings for a Polygon or MultiPolygon geometry '''
+
+    if geometry['type'] == 'MultiPolygon':
+        return [ring for polygon in geometry['coordinates'] for ring in polygon]
+    else:
+        return geometry['coordinates']
+
+
+def build_adjacency(geojson, key):
+    ''' Returns compressed adjacency (codes, offsets, neighbours) for areas in geojson that share a boundary edge.
+        Neighbours of codes[i] are codes[neighbours[offsets[i]:offsets[i+1]]] '''
+
+    codes = sorted(feature['properties'][key] for feature in geojson['features'])
+    index = {code: i for i, code in enumerate(codes)}
+
+    # Map each boundary edge (unordered pair of rounded vertices) to the areas using it
+    edges = {}
+    for feature in geojson['features']:
+        area = index[feature['properties'][key]]
+        for ring in polygon_rings(feature['geometry']):
+            points = [(round(x, COORD_PRECISION), round(y, COORD_PRECISION)) for x, y in ring]
+            for a, b in zip(points, points[1:]):
+                edges.setdefault((a, b) if a < b else (b, a), set()).add(area)
+
+    pairs = set()
+    for areas in edges.values():
+        if len(areas) > 1:
+            pairs.update(itertools.permutations(areas, 2))
+
+    pairs = sorted(pairs)
+    offsets = np.searchsorted(np.array([p[0] for p in pairs], dtype=np.int32), np.arange(len(codes) + 1)).astype(np.int32)
+    neighbours = np.array([p[1] for p in pairs], dtype=np.int32)
+
+    return {'codes': codes, 'offsets': offsets, 'neighbours': neighbours}
+
+
+class AreaGraph:
+    ''' Area adjacency graph for one hierarchy level, from the compressed adjacency saved by the batch '''
+
+    def __init__(self, adjacency):
+
+        self.codes = adjacency['codes']
+        self.offsets = adjacency['offsets']
+        self.neighbours = adjacency['neighbours']
+
+
+    def find_clusters(self, values, threshold, min_size=2):
+        ''' Returns clusters (lists of area codes) of adjacent areas with values above threshold, largest first.
+            values is a pandas series of measure values indexed by area code '''
+
+        hot = (values.reindex(self.codes) > threshold).values
+        seen = np.zeros(len(self.codes), dtype=bool)
+
+        clusters = []
+        for start in np.flatnonzero(hot):
+            if seen[start]:
+                continue
+
+            # Breadth first search through hot neighbours
+            seen[start] = True
+            cluster, queue = [], deque([start])
+            while queue:
+                i = queue.popleft()
+                cluster.append(i)
+                for j in self.neighbours[self.offsets[i]:self.offsets[i+1]]:
+                    if hot[j] and not seen[j]:
+                        seen[j] = True
+                        queue.append(j)
+
+            if len(cluster) >= min_size:
+                clusters.append(sorted(self.codes[i] for i in cluster))
+
+        return sorted(clusters, key=lambda c: (-len(c), c[0]))
+
+
+
+class AreaLocator:
+    ''' Spatial index of area boundaries for finding the areas containing a point (lat/lon).
+        Polygons are bucketed into a grid by bounding box, and each polygon's edges are split into horizontal
+        bands, so a lookup only ray casts against a handful of edges from a few candidate polygons '''
+
+    def __init__(self, geo_data):
+
+        self.grids = {}
+        for level, geo in geo_data.items():
+            grid = {}
+            for feature in geo['data']['features']:
+                code = feature['properties'][geo['key']]
+                geometry = feature['geometry']
+                polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+
+                for polygon in polygons:
+                    entry = self._index_polygon(polygon, code)
+                    x0, y0, x1, y1 = entry[0]
+                    for i in range(self._cell(x0), self._cell(x1) + 1):
+                        for j in range(self._cell(y0), self._cell(y1) + 1):
+                            grid.setdefault((i, j), []).append(entry)
+
+            self.grids[level] = grid
+
+
+    def _cell(self, value):
+        ''' Grid cell number for a coordinate '''
+
+        return int(math.floor(value / GRID_SIZE))
+
+
+    def _index_polygon(self, polygon, code):
+        ''' Returns (bounding box, band height, edge bands, area code) index entry for a polygon (outer ring & holes) '''
+
+        xs = [p[0] for p in polygon[0]]
+        ys = [p[1] for p in polygon[0]]
+        bbox = (min(xs), min(ys), max(xs), max(ys))
+        height = (bbox[3] - bbox[1]) / EDGE_BANDS or 1
+
+        bands = [[] for _ in range(EDGE_BANDS)]
+        for ring in polygon:
+            for (xa, ya), (xb, yb) in zip((p[:2] for p in ring), (p[:2] for p in ring[1:])):
+                low = int((min(ya, yb) - bbox[1]) / height)
+                high = int((max(ya, yb) - bbox[1]) / height)
+                for band in range(max(low, 0), min(high, EDGE_BANDS - 1) + 1):
+                    bands[band].append((xa, ya, xb, yb))
+
+        return bbox, height, bands, code
+
+
+    def locate(self, lat, lon):
+        ''' Returns dictionary of level : area code for the areas containing the point '''
+
+        cell = (self._cell(lon), self._cell(lat))
+        found = {}
+
+        for level, grid in self.grids.items():
+            for (x0, y0, x1, y1), height, bands, code in grid.get(cell, []):
+                if x0 <= lon <= x1 and y0 <= lat <= y1:
+
+                    # Even-odd ray cast - crossings of holes cancel out
+                    inside = False
+                    for xa, ya, xb, yb in bands[min(int((lat - y0) / height), EDGE_BANDS - 1)]:
+                        if (ya > lat) != (yb > lat) and lon < (xb - xa) * (lat - ya) / (yb - ya) + xa:
+                            inside = not inside
+
+                    if inside:
+                        found[level] = code
+                        break
+
+        return found
+
+
+
+######################################################################################################
+# Boundary simplification
+
+
+def simplify_geojson(geojson, key, tolerance, precision):
+    ''' Returns simplified copy of geojson with coordinates rounded to precision and properties reduced to the key.
+        Topology is preserved by splitting rings into arcs at junctions (points where 3 or more boundary lines meet)
+        and simplifying each arc once, so neighbouring areas keep identical shared borders '''
+
+    features = [(feature['properties'][key], [[[tuple(round(c, COORD_PRECISION) for c in p[:2]) for p in ring] for ring in polygon]
+                    for polygon in (feature['geometry']['coordinates'] if feature['geometry']['type'] == 'MultiPolygon' else [feature['geometry']['coordinates']])])
+                for feature in geojson['features']]
+
+    # Junctions - points joined to more than 2 distinct points along boundaries
+    links = {}
+    for code, polygons in features:
+        for polygon in polygons:
+            for ring in polygon:
+                for a, b in zip(ring, ring[1:]):
+                    if a != b:
+                        links.setdefault(a, set()).add(b)
+                        links.setdefault(b, set()).add(a)
+    junctions = set(point for point, linked in links.items() if len(linked) > 2)
+
+    arcs = {}
+    simplified = []
+    for code, polygons in features:
+        multipolygon = []
+        for polygon in polygons:
+            rings = [_simplify_ring(ring, junctions, arcs, tolerance, precision) for ring in polygon]
+            if rings[0] is not None:
+                multipolygon.append([ring for ring in rings if ring is not None])
+
+        # Small areas that collapse entirely keep their unsimplified outer rings
+        if not multipolygon:
+            multipolygon = [[[[round(x, precision), round(y, precision)] for x, y in polygon[0]]] for polygon in polygons]
+
+        simplified.append({'type' : 'Feature', 'properties' : {key : code},
+                           'geometry' : {'type' : 'MultiPolygon', 'coordinates' : multipolygon}})
+
+    return {'type' : 'FeatureCollection', 'features' : simplified}
+
+
+def _simplify_ring(ring, junctions, arcs, tolerance, precision):
+    ''' Simplifies a closed ring arc by arc, returns rounded ring or None if it collapses '''
+
+    points = [p for i, p in enumerate(ring[:-1]) if p != ring[i-1] or i == 0]
+    if len(points) < 3:
+        return None
+
+    # Start at a junction (or the lowest point for rings with none, so enclave / hole pairs match)
+    starts = [i for i, p in enumerate(points) if p in junctions]
+    first = starts[0] if starts else points.index(min(points))
+    points = points[first:] + points[:first] + [points[first]]
+
+    result = [points[0]]
+    start = 0
+    for i in range(1, len(points)):
+        if i == len(points) - 1 or points[i] in junctions:
+            result.extend(_simplify_arc(tuple(points[start:i+1]), arcs, tolerance)[1:])
+            start = i
+
+    # Round, removing repeated points
+    rounded = []
+    for x, y in result:
+        point = [round(x, precision), round(y, precision)]
+        if not rounded or point != rounded[-1]:
+            rounded.append(point)
+
+    return rounded if len(rounded) >= 4 else None
+
+
+def _simplify_arc(arc, arcs, tolerance):
+    ''' Returns simplified arc, simplifying each distinct arc only once whichever direction it's traversed in '''
+
+    reverse = arc[::-1]
+    forward = arc <= reverse
+    canonical = arc if forward else reverse
+
+    if canonical not in arcs:
+        arcs[canonical] = douglas_peucker(canonical, tolerance)
+
+    return arcs[canonical] if forward else arcs[canonical][::-1]
+
+
+def douglas_peucker(points, tolerance):
+    ''' Returns list of points simplified with the Douglas-Peucker algorithm (end points always kept) '''
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+
+        furthest, distance = None, tolerance
+        for i in range(first + 1, last):
+            x, y = points[i]
+            d = abs(dy * (x - x1) - dx * (y - y1)) / length if length else math.hypot(x - x1, y - y1)
+            if d > distance:
+                furthest, distance = i, d
+
+        if furthest is not None:
+            keep[furthest] = True
+            stack.append((first, furthest))
+            stack.append((furthest, last))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplified_filename(filename, resolution):
+    ''' Returns file name of simplified geojson for original geojson file name & resolution '''
+
+    return filename.replace('.json', '.' + resolution + '.json')
+
+
+def _figure_seconds(geojson, key):
+    ''' Returns seconds to build and serialise a choropleth figure for geojson (server side render cost) '''
+
+    import plotly.graph_objects as go
+
+    codes = [feature['properties'][key] for feature in geojson['features']]
+    start = time.time()
+    go.Figure(go.Choroplethmapbox(geojson=geojson, locations=codes, z=list(range(len(codes))), featureidkey="properties." + key)).to_json()
+    return time.time() - start
+
+
+if __name__ == '__main__':
+
+    # Generate simplified geojson files for each resolution and report size / render time against the originals
+
+    for filename, key in GEO_FILES.items():
+        if not os.path.exists(GEO_DIR + filename):
+            continue
+
+        with open(GEO_DIR + filename, encoding="utf-8") as f:
+            original = json.load(f)
+
+        print(f"\n{filename}")
+        print(f"  original   {os.path.getsize(GEO_DIR + filename):>10,} bytes   render {_figure_seconds(original, key):.3f}s")
+
+        for resolution, params in GEO_RESOLUTIONS.items():
+            start = time.time()
+            geojson = simplify_geojson(original, key, params['tolerance'], params['precision'])
+            build = time.time() - start
+
+            outfile = simplified_filename(filename, resolution)
+            with open(GEO_DIR + outfile, "w", encoding="utf-8") as f:
+                json.dump(geojson, f, separators=(",", ":"))
+
+            print(f"  {resolution:<10} {os.path.getsize(GEO_DIR + outfile):>10,} bytes   render {_figure_seconds(geojson, key):.3f}s   (simplified in {build:.1f}s)")
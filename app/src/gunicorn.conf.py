@@ -0,0 +1,18 @@
+# Gunicorn settings for the app container (gunicorn --config gunicorn.conf.py app:server)
+#
+# Threaded workers - each worker process holds one copy of the case data (shared with the others when memory mapped,
+# see CASES_MMAP_DIR) and serves many requests at once from it.  Every request is short (browsers' data generation
+# checks wait at most a couple of seconds), so idle browsers don't hold threads.  Override with GUNICORN_WORKERS /
+# GUNICORN_THREADS.
+
+import multiprocessing
+import os
+
+bind = '0.0.0.0:5001'
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', min(4, multiprocessing.cpu_count())))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+# Long enough for a worker's first data load & map figure prebuild
+timeout = 120
+accesslog = '-'
@@ -0,0 +1,229 @@
+''' Render cache shared by every app worker and container - finished layout & callback responses (figures, table pages,
+    page layouts) are kept compressed in redis, keyed on the data generation and the normalised request.
+
+    One worker renders a response: the first to miss claims it (a short lived redis lock), the others wait for its result
+    rather than rendering the same thing.  Within a worker, concurrent identical requests are coalesced the same way
+    (SingleFlight), so only one thread even asks redis.  Entries expire (and redis evicts them least recently used
+    first when full, see maxmemory-policy volatile-lru in docker-compose), and a new generation simply uses new keys. '''
+
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import redis
+
+RENDER_PREFIX = 'Render.'
+RENDER_CACHE_TTL = 60 * 60 * 6      # Seconds rendered responses are kept (a new data generation uses new keys anyway)
+RENDER_LOCK_SECONDS = 30            # Longest we expect a render to take - after this another worker may render it
+RENDER_WAIT_SECONDS = 1            # Longest we wait for another worker's render before doing it ourselves
+FLIGHT_WAIT_SECONDS = 1            # Longest we wait for the same render on another thread of this worker
+RENDER_POLL_SECONDS = 0.05
+
+
+def render_key(generation, path, body):
+    ''' Returns cache key for a request - data generation, path and request body (callback inputs) with its
+        json keys sorted, so the same request from different browsers shares a key '''
+
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        pass
+
+    return hashlib.md5((str(generation) + path + body).encode()).hexdigest()
+
+
+class ResponseCache:
+    ''' Bounded LRU cache (in this worker) of rendered values - response bodies, figures - keyed on the request.
+        Values are only valid for one data generation, so the cache empties itself when the generation changes '''
+
+    def __init__(self, maxsize):
+
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, key, generation):
+        ''' Returns cached value for key or None '''
+
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+
+            return value
+
+
+    def put(self, key, generation, value):
+        ''' Adds value to cache, evicting least recently used values if full '''
+
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+
+    def stats(self):
+        ''' Returns cache counters '''
+
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+
+class RenderCache:
+    ''' Redis cache of rendered responses.  Redis errors are counted and treated as misses, so the app keeps
+        rendering for itself if the cache goes away '''
+
+    def __init__(self, redis_connection, ttl=RENDER_CACHE_TTL):
+
+        self.redis = redis_connection
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+    def _count(self, counter):
+
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    def _fetch(self, key):
+        ''' Returns cached response body for key or None '''
+
+        try:
+            payload = self.redis.get(RENDER_PREFIX + key)
+        except redis.RedisError:
+            self._count('errors')
+            return None
+
+        return zlib.decompress(payload) if payload is not None else None
+
+
+    def get(self, key, wait=RENDER_WAIT_SECONDS):
+        ''' Returns cached response body for key, or None if the caller should render it.  If another worker is
+            already rendering it we wait (up to wait seconds) for its result '''
+
+        body = self._fetch(key)
+        if body is not None:
+            self._count('hits')
+            return body
+
+        self._count('misses')
+        if self.claim(key):
+            return None
+
+        # Someone else is rendering - wait for it, or until their claim lapses
+        self._count('waits')
+        waiting = time.time() + wait
+        while time.time() < waiting:
+            time.sleep(RENDER_POLL_SECONDS)
+            body = self._fetch(key)
+            if body is not None:
+                return body
+            try:
+                if not self.redis.exists(RENDER_PREFIX + 'Lock.' + key):
+                    break
+            except redis.RedisError:
+                break
+
+        return None
+
+
+    def claim(self, key):
+        ''' Claims rendering of key for this worker.  Returns False if another worker already has it '''
+
+        try:
+            return bool(self.redis.set(RENDER_PREFIX + 'Lock.' + key, 1, nx=True, ex=RENDER_LOCK_SECONDS))
+        except redis.RedisError:
+            self._count('errors')
+            return True
+
+
+    def put(self, key, body):
+        ''' Stores rendered response body (compressed) and releases our claim on it '''
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(RENDER_PREFIX + key, zlib.compress(body), ex=self.ttl)
+            pipe.delete(RENDER_PREFIX + 'Lock.' + key)
+            pipe.execute()
+        except redis.RedisError:
+            self._count('errors')
+
+
+    def release(self, key):
+        ''' Releases our claim on key without storing anything (the response wasn't cacheable) '''
+
+        try:
+            self.redis.delete(RENDER_PREFIX + 'Lock.' + key)
+        except redis.RedisError:
+            self._count('errors')
+
+
+    def stats(self):
+        ''' Returns cache counters '''
+
+        return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'errors': self.errors}
+
+
+
+class SingleFlight:
+    ''' Coalesces concurrent identical requests in this worker - the first renders the response, the others wait for
+        it to finish and use its result '''
+
+    def __init__(self):
+
+        self.flights = {}
+        self.renders = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+
+
+    def join(self, key):
+        ''' Returns True if the caller should render key (and finish it afterwards), otherwise waits (briefly) for the
+            render already in flight and returns False '''
+
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                self.flights[key] = threading.Event()
+                self.renders += 1
+                return True
+            self.coalesced += 1
+
+        flight.wait(FLIGHT_WAIT_SECONDS)
+        return False
+
+
+    def finish(self, key):
+        ''' Marks render of key done, releasing the requests waiting for it '''
+
+        with self.lock:
+            flight = self.flights.pop(key, None)
+
+        if flight is not None:
+            flight.set()
+
+
+    def stats(self):
+        ''' Returns coalescing counters '''
+
+        return {'in_flight': len(self.flights), 'renders': self.renders, 'coalesced': self.coalesced}
@@ -1,6 +1,20 @@
 import dash
 import dash_html_components as html
+import dash_core_components as dcc
 import dash_table
+import pandas as pd
+import numpy as np
+import threading
+import math
+import re
+
+TABLE_PAGE_SIZE = 25
+FILTER_PATTERN = re.compile(r'^\{(?P<col>[^}]+)\}\s*(?P<op>>=|<=|!=|<|>|=|eq|ne|lt|le|gt|ge|contains|datestartswith)\s*(?P<value>.*)$')
+FILTER_OPERATORS = {
+    '=' : np.equal, 'eq' : np.equal, '!=' : np.not_equal, 'ne' : np.not_equal,
+    '<' : np.less, 'lt' : np.less, '<=' : np.less_equal, 'le' : np.less_equal,
+    '>' : np.greater, 'gt' : np.greater, '>=' : np.greater_equal, 'ge' : np.greater_equal
+}
 
 TABLE_METADATA = {
     'table1' : { 
@@ -24,16 +38,41 @@ TABLE_METADATA = {
         'sortcol' : 'Area name',
         'ascending' : True
     },
+    'table4' : { 
+        'cols' : ['Cluster','Cluster Size','Area name','Population','Last 14 Days Trend Slope','Cases in Last 7 Days'],
+        'filtercol' : 'Last 14 Days Trend Slope',
+        'filtervalue' : 0.05,
+        'sortcol' : 'Last 14 Days Trend Slope',
+        'ascending' : False,
+        'clusters' : True
+    },
+    'table5' : { 
+        'cols' : ['Cluster','Cluster Size','Area name','Population','Last 7 Days Cases Per 1000 People','Cases in Last 7 Days'],
+        'filtercol' : 'Last 7 Days Cases Per 1000 People',
+        'filtervalue' : 1.0,
+        'sortcol' : 'Last 7 Days Cases Per 1000 People',
+        'ascending' : False,
+        'clusters' : True
+    },
 }
 
-class TableLayout:
-    ''' Dash Tables html layout creation '''
+class TableView:
+    ''' Filtered & sorted table data for one table & level, built once per data generation with its table records
+        (area names as hyperlinks) ready to serve.  Serves table pages, sorted & filtered on the server using row
+        orders presorted (on first use) for each column '''
+
+    def __init__(self, tableparams, cases):
 
-    def __init__(self, tableparams, df):
-        
         self.tableparams = tableparams
-        self.tabledf = self._filter_dataframe(df)
-        self.layout = self._get_layout()
+        self.cases = cases
+        self.tabledf = self._filter_dataframe(cases.summarydf).reset_index(drop=True)
+        self.orders = {}
+
+        recordsdf = self.tabledf
+        if self.tableparams['hyperlink']:
+            recordsdf = self.tabledf.assign(**{'Area name': self._make_hyperlinks(self.tabledf['Area name'], self.tableparams['plotlevel'])})
+        self.records = recordsdf.to_dict('records')
+        self.first_page = self.page()
 
 
     def _filter_dataframe(self, df):
@@ -56,20 +95,179 @@ class TableLayout:
         return tdf
 
 
-    def _get_layout(self):
-        ''' Generates table layout '''
+    def page(self, page_current=0, page_size=TABLE_PAGE_SIZE, sort_by=None, filter_query=''):
+        ''' Returns (records, page count) for a page of the table, sorted & filtered as the table requests '''
 
-        if self.tableparams['hyperlink']:
-            self.tabledf['Area name'] = self.tabledf.apply(lambda x: self._make_hyperlink(x['Area name'],self.tableparams['plotlevel']), axis=1)
+        if sort_by:
+            rows = self._sort_order(tuple((sort['column_id'], sort['direction'] == 'asc') for sort in sort_by))
+        else:
+            rows = np.arange(len(self.tabledf))
+
+        mask = self._filter_mask(filter_query)
+        if mask is not None:
+            rows = rows[mask[rows]]
+
+        page_count = max(1, math.ceil(len(rows) / page_size))
+
+        return [self.records[i] for i in rows[page_current * page_size : (page_current + 1) * page_size]], page_count
+
+
+    def _sort_order(self, sorts):
+        ''' Returns row positions in order of the (column, ascending) sorts, first column first (missing values last) '''
+
+        if sorts not in self.orders:
+            self.orders[sorts] = self.tabledf.reset_index(drop=True).sort_values(by=[col for col, ascending in sorts],
+                ascending=[ascending for col, ascending in sorts], kind='mergesort').index.values
+
+        return self.orders[sorts]
+
+
+    def _filter_mask(self, filter_query):
+        ''' Returns boolean row mask for a table filter query (e.g. '{Population} > 100000 && {Area name} contains Lon') 
+            or None if there's nothing to filter.  A clause we can't parse matches no rows, rather than being ignored '''
+
+        mask = None
+        nomatch = np.zeros(len(self.tabledf), dtype=bool)
+        for part in (filter_query or '').split(' && '):
+            if not part.strip():
+                continue
+
+            match = FILTER_PATTERN.match(part.strip())
+            if not match or match.group('col') not in self.tabledf.columns:
+                return nomatch
+
+            column = self.tabledf[match.group('col')]
+            op = match.group('op')
+            value = match.group('value').strip().strip('"\'`')
+
+            if op == 'contains':
+                partmask = column.astype(str).str.contains(value, case=False, regex=False).values
+            elif op == 'datestartswith':
+                partmask = column.astype(str).str.startswith(value).values
+            elif column.dtype.kind in 'iuf':
+                try:
+                    partmask = FILTER_OPERATORS[op](column.values, float(value))
+                except ValueError:
+                    return nomatch
+            else:
+                partmask = FILTER_OPERATORS[op](column.astype(str).values, value)
+
+            mask = partmask if mask is None else mask & partmask
+
+        return mask
+
+
+    def _make_hyperlinks(self, areas, plotlevel):
+        ''' Generates area name table hyperlinks (for a series of area names) '''
+        urls = 'chart7/'+plotlevel.replace(' ','%20')+'/'+areas.str.replace(' ','%20', regex=False)+'/Cases|Average/Daily%20Cases:*/28/'
+        return '['+areas+']('+urls+')'
+
+
+
+class ClusterTableView(TableView):
+    ''' Table of hotspot clusters - groups of adjacent areas where the table filter column exceeds the filter value '''
+
+    def _filter_dataframe(self, df):
+        ''' Create data frame of areas in clusters, largest clusters first '''
+
+        table = TABLE_METADATA[self.tableparams['link']]
+        leveldf = df.loc[df['Area type'] == self.tableparams['plotlevel']].set_index('Area code')
+
+        graph = self.cases.adjacency.get(self.tableparams['plotlevel'])
+        clusters = graph.find_clusters(leveldf[table['filtercol']], table['filtervalue']) if graph else []
+
+        rows = [(code, i+1, len(cluster)) for i, cluster in enumerate(clusters) for code in cluster]
+        clusterdf = pd.DataFrame(rows, columns=['Area code','Cluster','Cluster Size']).set_index('Area code')
+
+        tdf = clusterdf.join(leveldf)[table['cols']]
+        return tdf.sort_values(by=['Cluster', table['sortcol']], ascending=[True, table['ascending']])
+
+
+
+class TableViews:
+    ''' Table views for the current data generation - every table & level is prebuilt after each data load '''
+
+    def __init__(self):
+
+        self.views = {}
+        self.generation = None
+        self.lock = threading.Lock()
+
+
+    def get(self, tableparams, cases):
+        ''' Returns table view for table parameters & data '''
+
+        key = (tableparams['link'], tableparams['plotlevel'], tableparams['hyperlink'])
+
+        # Views are for one generation only (requests for other data, e.g. during a reload, get a view built for them)
+        with self.lock:
+            view = self.views.get(key) if cases.latest_data_load_timestamp == self.generation else None
+
+        if view is None:
+            viewclass = ClusterTableView if TABLE_METADATA[tableparams['link']].get('clusters') else TableView
+            view = viewclass(tableparams, cases)
+            with self.lock:
+                if cases.latest_data_load_timestamp == self.generation:
+                    self.views[key] = view
+
+        return view
+
+
+    def prebuild(self, cases):
+        ''' Builds views of every table at every level for the loaded data '''
+
+        if len(cases.summarydf) == 0:
+            return
+
+        views = {}
+        for link, table in TABLE_METADATA.items():
+            for level in cases.levels:
+                tableparams = {'link' : link, 'plotlevel' : level, 'hyperlink' : True}
+                viewclass = ClusterTableView if table.get('clusters') else TableView
+                views[(link, level, True)] = viewclass(tableparams, cases)
+
+        # Swap in complete set
+        with self.lock:
+            self.views = views
+            self.generation = cases.latest_data_load_timestamp
+
+
+table_views = TableViews()
+
+
+
+class TableLayout:
+    ''' Dash Tables html layout creation.  Tables are paged, with sorting & filtering done on the server '''
+
+    def __init__(self, tableparams, view):
         
+        self.tableparams = tableparams
+        self.view = view
+        self.layout = self._get_layout()
+
+
+    def _get_layout(self):
+        ''' Generates table layout (with first page of data, later pages come from the table page callback) '''
+
+        data, page_count = self.view.first_page
+
         return html.Div(children=[
             html.H4(children=self.tableparams['plottitle']),
+            dcc.Store(id='table-params', data=self.tableparams),
             dash_table.DataTable(
                 id='datatable-interactivity',
                 columns=[
-                    {'name': i, 'id': i, 'selectable': True, 'presentation': self._column_presentation(i) } for i in self.tabledf.columns
+                    {'name': i, 'id': i, 'selectable': True, 'presentation': self._column_presentation(i) } for i in self.view.tabledf.columns
                 ],
-                sort_action='native',
+                page_action='custom',
+                page_current=0,
+                page_size=TABLE_PAGE_SIZE,
+                page_count=page_count,
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
                 markdown_options={'link_target': '_self'},
                 style_table={'width': '100%', 'minWidth': '100%', 'overflow':'auto'},
                 style_cell={'height':'25px','vertical-align':'top','padding-top':'1px','font-family':'sans-serif', 'padding-left':'5px','padding-right':'5px','border': 'solid 1px #DDEEEE'},
@@ -105,7 +303,7 @@ class TableLayout:
                         'color': 'red'
                     },
                     ],
-                data=self.tabledf.to_dict('records')
+                data=data
             )
         ])
 
@@ -113,9 +311,3 @@ class TableLayout:
     def _column_presentation(self, col):
         ''' Determines whether to represent column as markdown '''
         return 'markdown' if col=='Area name' else 'input'
-
-
-    def _make_hyperlink(self, area, plotlevel):
-        ''' Generates area name table hyperlink '''
-        url = 'chart7/'+plotlevel.replace(' ','%20')+'/'+area.replace(' ','%20')+'/Cases|Average/Daily%20Cases:*/28/'
-        return '['+area+']('+url+')'
@@ -0,0 +1,173 @@
+''' Render cache warmer.  After each new data generation is published, one app worker (across all workers & containers)
+    replays the hot requests - the configured pages plus the callbacks browsers have asked for most - through the app,
+    so their responses are rendered into the shared render cache before users ask for them. '''
+
+import json
+import threading
+import time
+import urllib.parse
+from collections import Counter
+import redis
+
+WARM_REQUESTS_KEY = 'Render.Requests'    # Sorted set of request counts (json path & body) recorded by the app
+WARM_TOP_REQUESTS = 100         # Most requested callbacks replayed for each new generation
+WARM_TRACKED_REQUESTS = 1000    # Distinct requests we keep counts for
+WARM_LOCK_SECONDS = 60 * 30
+WARM_CHECK_SECONDS = 60         # How often we check for a generation we've not warmed (besides load notifications), and
+                                # add this worker's request counts to redis
+WARM_REQUESTS_TTL = 60 * 60 * 24 * 7    # Request counts expire if no worker adds to them for this long
+WARM_HEADER = 'X-Cache-Warm'    # Marks the warmer's own requests, so they aren't counted
+
+# Characters browsers leave as they are in a url path (location.pathname) - the printable ones outside the WHATWG
+# path percent-encode set (space " # < > ? ` { }), including | : * ( ) and % of already encoded characters
+PATH_SAFE = "!$%&'()*+,-./:;=@[\\]^_|~"
+
+
+def is_recorded(path, body):
+    ''' Returns True if a request should be counted for warming - not location searches (a user's position), or map
+        callbacks for a panned / zoomed map (every view is different) '''
+
+    if not body:
+        return True
+
+    try:
+        inputs = json.loads(body).get('inputs', [])
+    except (ValueError, AttributeError):
+        return False
+
+    for item in inputs if isinstance(inputs, list) else []:
+        if not isinstance(item, dict):
+            return False
+        if item.get('property') == 'relayoutData' and item.get('value'):
+            return False
+        if item.get('property') == 'pathname' and urllib.parse.unquote(str(item.get('value'))).startswith('/find'):
+            return False
+
+    return True
+
+
+def page_request(path):
+    ''' Returns (path, body) of the dash callback request a browser makes to render a page at url path (the pathname
+        the browser sends, percent-encoded as browsers do) '''
+
+    body = {
+        'output': '..page-content.children...intermediate-value.children..',
+        'outputs': [{'id': 'page-content', 'property': 'children'}, {'id': 'intermediate-value', 'property': 'children'}],
+        'inputs': [{'id': 'url', 'property': 'pathname', 'value': urllib.parse.quote(path, safe=PATH_SAFE)}],
+        'changedPropIds': ['url.pathname']
+    }
+    return '/_dash-update-component', json.dumps(body)
+
+
+class CacheWarmer:
+    ''' Replays hot requests through the app for each new data generation, and records how often requests are made '''
+
+    def __init__(self, server, cases, pages):
+
+        self.server = server
+        self.cases = cases
+        self.redis = cases.redis_connection
+        self.pages = pages
+        self.generation = None
+        self.last_warm = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+
+    def record(self, path, body):
+        ''' Counts a layout / callback request (so the most popular are warmed).  Counts are kept in memory, and
+            added to redis in a batch every WARM_CHECK_SECONDS (see flush) '''
+
+        if not is_recorded(path, body):
+            return
+
+        request = json.dumps({'path': path, 'body': body})
+        with self.lock:
+            if request in self.counts or len(self.counts) < WARM_TRACKED_REQUESTS:
+                self.counts[request] += 1
+
+
+    def flush(self):
+        ''' Adds this worker's request counts to the shared counts in redis, keeping only the most requested '''
+
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+
+        if not counts:
+            return
+
+        try:
+            pipe = self.redis.pipeline()
+            for request, count in counts.items():
+                pipe.zincrby(WARM_REQUESTS_KEY, count, request)
+            pipe.zremrangebyrank(WARM_REQUESTS_KEY, 0, -WARM_TRACKED_REQUESTS - 1)
+            pipe.expire(WARM_REQUESTS_KEY, WARM_REQUESTS_TTL)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+
+    def start(self):
+        ''' Starts thread warming the cache whenever new data is published '''
+
+        threading.Thread(target=self._watch, daemon=True).start()
+
+
+    def _watch(self):
+
+        while True:
+            generation = self.cases.snapshot.latest_data_load_timestamp
+            if generation is not None and generation != self.generation:
+                self.generation = generation
+                try:
+                    self.warm(generation)
+                except redis.RedisError:
+                    print("Cache warming failed, redis unavailable")
+
+            self.flush()
+            self.cases.wait_for_load(WARM_CHECK_SECONDS)
+
+
+    def warm(self, generation):
+        ''' Renders configured pages & most requested callbacks for generation, unless another worker already is '''
+
+        if not self.redis.set('Render.Warm.' + str(generation), 1, nx=True, ex=WARM_LOCK_SECONDS):
+            return
+
+        started = time.time()
+
+        # Most requested first (not any recorded before location searches & map views were left out), then any
+        # configured pages not among them
+        requests = [(r['path'], r['body']) for r in map(json.loads, self.redis.zrevrange(WARM_REQUESTS_KEY, 0, WARM_TOP_REQUESTS - 1))]
+        requests = [(path, body) for path, body in requests if is_recorded(path, body)]
+        requests += [('/_dash-layout', '')] + [page_request(path) for path in self.pages]
+        requests = list(dict.fromkeys(requests))
+
+        # Forget the least popular requests, and halve the rest so recent popularity counts most
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyrank(WARM_REQUESTS_KEY, 0, -WARM_TRACKED_REQUESTS - 1)
+        pipe.zunionstore(WARM_REQUESTS_KEY, {WARM_REQUESTS_KEY: 0.5})
+        pipe.expire(WARM_REQUESTS_KEY, WARM_REQUESTS_TTL)
+        pipe.execute()
+
+        client = self.server.test_client()
+        failed = 0
+        for path, body in requests:
+            if self.cases.snapshot.latest_data_load_timestamp != generation:
+                break
+            if body:
+                response = client.post(path, data=body, content_type='application/json', headers={WARM_HEADER: '1'})
+            else:
+                response = client.get(path, headers={WARM_HEADER: '1'})
+            if response.status_code not in (200, 204):
+                failed += 1
+
+        self.last_warm = {'generation': str(generation), 'requests': len(requests), 'failed': failed,
+                          'seconds': round(time.time() - started, 2)}
+        print("Cache warmed", self.last_warm)
+
+
+    def stats(self):
+        ''' Returns details of the last warming done by this worker '''
+
+        return self.last_warm
@@ -0,0 +1,140 @@
+import os, sys
+import pytest
+import numpy as np
+import pandas as pd
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from aggregates import AREA_KEYS, CasesAccumulator, calc_changed_areas, calc_daily_totals, calc_weekly_cases, calc_slopes, check_consistency, check_month_totals, get_last30, patch_weekly_summary, run_level_stage, summary_stage, weekly_stage
+
+# Made up daily cases - the Region level ends 2 days before the Nation (as specimen date levels can)
+
+rng = np.random.default_rng(1)
+areas = [('E92000001','England','Nation', '2020-10-01'), ('E12000007','London','Region', '2020-09-29'), ('E12000004','East Midlands','Region', '2020-09-29')]
+
+dailydf = pd.concat([pd.DataFrame({'Date': pd.date_range('2020-08-01', end), 'Area code': code, 'Area name': name, 'Area type': level,
+                                   'Cases': rng.integers(0, 100, len(pd.date_range('2020-08-01', end)))})
+                     for code, name, level, end in areas]).set_index('Date').sort_index()
+populationdf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for code, name, level, end in areas]).set_index(AREA_KEYS)
+levels = ['Nation', 'Region']
+
+
+def baseline_trend_stats(dailydf):
+    ''' Trend stats as the batch calculated them before levels were split - one pivot over every level's dates '''
+
+    sdf = dailydf.loc[dailydf.index >= get_last30(dailydf.index.max())].reset_index()
+    cases = sdf.pivot_table(index=AREA_KEYS, columns='Date', values='Cases', aggfunc=np.sum).fillna(0)
+
+    return pd.DataFrame({'Last 14 Days Trend Slope': calc_slopes(cases.values), 'Cases in Last 7 Days': cases.values[:, -7:].sum(axis=1).astype(int)},
+                        index=cases.index)
+
+
+def test_trend_stats_by_level():
+
+    # Levels ending early get the same date windows as the latest level
+    weeklydf = weekly_stage(dailydf, levels)
+    summarydf = summary_stage(dailydf, weeklydf, populationdf, levels).set_index(AREA_KEYS)
+    expected = baseline_trend_stats(dailydf)
+
+    pd.testing.assert_frame_equal(summarydf.loc[expected.index, expected.columns], expected, check_dtype=False)
+
+
+def test_patch_matches_rebuild():
+
+    # Published frames built from data to a Friday, then the same data plus a revision for London, and with new days
+    # completing a week (Regions end 2 days before the Nation, so they get new days too)
+    previousdf = dailydf.loc[dailydf.index <= '2020-09-25']
+    previous_weekly = weekly_stage(previousdf, levels)
+    previous_totals = calc_daily_totals(previousdf)
+
+    newdf = dailydf.copy()
+    newdf.loc[(newdf.index == '2020-09-10') & (newdf['Area name'] == 'London'), 'Cases'] += 50
+
+    for latest in ['2020-09-25', '2020-10-01']:
+        df = newdf.loc[newdf.index <= latest]
+        changed = calc_changed_areas(df.loc[df.index <= previousdf.index.max()], previousdf)
+        assert changed == {('E12000007','London','Region')}
+
+        weeklydf, summarydf, totalsdf = patch_weekly_summary(df, previous_weekly, previous_totals, populationdf, changed, previousdf.index.max())
+        expected_weekly = weekly_stage(df, levels)
+        expected_summary = summary_stage(df, expected_weekly, populationdf, levels)
+
+        pd.testing.assert_frame_equal(weeklydf, expected_weekly.reset_index(drop=True), check_dtype=False)
+        pd.testing.assert_frame_equal(summarydf.set_index(AREA_KEYS).sort_index(), expected_summary.set_index(AREA_KEYS).sort_index(), check_dtype=False)
+        pd.testing.assert_frame_equal(totalsdf, calc_daily_totals(df), check_dtype=False)
+        assert check_consistency(df, weeklydf, summarydf)
+
+
+def test_streaming_matches_stages():
+
+    # Month partitions per level (as saved by the batch) folded one at a time give the same frames as the stages
+    accumulator = CasesAccumulator()
+    for (month, level), df in dailydf.groupby([dailydf.index.strftime('%Y-%m'), 'Area type']):
+        accumulator.add(df)
+    weeklydf, summarydf = accumulator.finalize(populationdf)
+
+    expected_weekly = weekly_stage(dailydf, levels)
+    expected_summary = summary_stage(dailydf, expected_weekly, populationdf, levels)
+
+    pd.testing.assert_frame_equal(weeklydf.reset_index(drop=True), expected_weekly.reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(summarydf.set_index(AREA_KEYS).sort_index(), expected_summary.set_index(AREA_KEYS).sort_index(), check_dtype=False)
+
+
+def test_consistency_row_counts():
+
+    weeklydf = weekly_stage(dailydf, levels)
+    summarydf = summary_stage(dailydf, weeklydf, populationdf, levels)
+
+    # A missing week with its cases moved to the next week keeps the totals, but not the row count
+    dropped = weeklydf.drop(index=weeklydf.index[0])
+    dropped.loc[dropped.index[0], 'Cases'] += weeklydf['Cases'].iloc[0]
+
+    assert check_consistency(dailydf, weeklydf, summarydf)
+    assert not check_consistency(dailydf, dropped, summarydf)
+    assert not check_consistency(dailydf, weeklydf, pd.concat([summarydf, summarydf.iloc[:1]]))
+
+
+def test_month_totals():
+
+    # Weekly levels aren't published for the first months - those are skipped, other missing months still fail
+    assert not check_month_totals([None, None, 200000, 100000], 250000, leading_empty=True)
+    assert check_month_totals([None, None, 200000, 100000], 250000)
+    assert check_month_totals([None, 200000, None, 100000], 250000, leading_empty=True)
+    assert check_month_totals([None, None], 250000, leading_empty=True)
+    assert check_month_totals([200000, float('nan')], 250000)
+    assert check_month_totals([200000], 250000)
+
+
+def test_no_partitions():
+
+    assert run_level_stage(len, [], workers=4) == []
+
+
+def test_workers_match_serial():
+
+    weeklydf = weekly_stage(dailydf, levels, workers=2)
+    summarydf = summary_stage(dailydf, weeklydf, populationdf, levels, workers=2)
+
+    pd.testing.assert_frame_equal(weeklydf, weekly_stage(dailydf, levels))
+    pd.testing.assert_frame_equal(summarydf, summary_stage(dailydf, weeklydf, populationdf, levels))
+
+
+def failing_weekly_cases(dailydf):
+
+    if (dailydf['Area type'] == 'Region').any():
+        raise ValueError('Region failed')
+    return calc_weekly_cases(dailydf)
+
+
+def test_failed_stage_frees_blocks():
+
+    # The Nation partition's result block is written before the Region one fails - neither input nor result blocks are left
+    blocks = set(os.listdir('/dev/shm'))
+    partitions = [(df,) for level, df in dailydf.groupby('Area type')]
+
+    with pytest.raises(ValueError):
+        run_level_stage(failing_weekly_cases, partitions, workers=2)
+
+    assert set(os.listdir('/dev/shm')) == blocks
@@ -0,0 +1,62 @@
+import os, sys
+import io
+import pandas as pd
+import pyarrow as pa
+import flask
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from dataframes import CasesData, CasesSnapshot
+from api import create_api
+
+# Small snapshot of made up data (no redis needed)
+
+dates = pd.date_range('2020-09-01', '2020-09-30')
+areas = [('Region','London','E12000007'), ('Region','East Midlands','E12000004'), ('Nation','England','E92000001')]
+
+dailydf = pd.concat([pd.DataFrame({'Date': dates, 'Area name': name, 'Area code': code, 'Area type': level,
+                                   'Cases': range(30), 'Tests': 0, 'Hospital Cases': 0, 'Deaths within 28 Days of Positive Test': 0})
+                     for level, name, code in areas]).set_index('Date').sort_index()
+weeklydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Date': date, 'Cases': 7}
+                         for level, name, code in areas for date in pd.date_range('2020-09-06', '2020-09-27', freq='7D')])
+summarydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for level, name, code in areas])
+
+cases = CasesData(batch=True)
+cases.snapshot = CasesSnapshot(cases, dailydf, weeklydf, summarydf, data_timestamp='2020-10-01 12:00:00')
+
+server = flask.Flask(__name__)
+server.register_blueprint(create_api(cases))
+client = server.test_client()
+
+
+def test_daily():
+
+    response = client.get('/api/daily?level=Region&area=London&start=2020-09-10&end=2020-09-12&columns=Cases')
+    assert response.status_code == 200
+    assert [row['Cases'] for row in response.get_json()] == [9, 10, 11]
+    assert set(response.get_json()[0]) == {'Date','Area name','Area code','Area type','Cases'}
+
+def test_level():
+
+    response = client.get('/api/weekly?level=Region')
+    assert {row['Area name'] for row in response.get_json()} == {'London','East Midlands'}
+
+def test_arrow():
+
+    response = client.get('/api/summary?level=Region&format=arrow')
+    table = pa.ipc.open_stream(io.BytesIO(response.data)).read_all()
+    assert sorted(table.column('Area name').to_pylist()) == ['East Midlands','London']
+
+def test_etag():
+
+    response = client.get('/api/summary?level=Nation')
+    assert client.get('/api/summary?level=Nation', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_bad_request():
+
+    assert client.get('/api/daily?level=Galaxy').status_code == 400
+    assert client.get('/api/daily?level=Region&columns=Nonsense').status_code == 400
+    assert client.get('/api/daily?level=Region&start=').status_code == 400
+    assert client.get('/api/daily?level=Region&end=NaT').status_code == 400
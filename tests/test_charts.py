@@ -0,0 +1,118 @@
+import os, sys
+import base64
+import json
+import re
+import numpy as np
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from dataframes import CasesData, CasesSnapshot
+from charts import CHART_WIDTH, PIXELS_PER_POINT, Chart, lttb
+
+# Small snapshot of made up data (no redis needed), long enough for all time charts to be downsampled
+
+dates = pd.date_range('2020-02-29', '2022-06-30')
+areas = [('Region','London','E12000007'), ('Region','East Midlands','E12000004'), ('Nation','England','E92000001')]
+rng = np.random.default_rng(1)
+
+dailydf = pd.concat([pd.DataFrame({'Date': dates, 'Area name': name, 'Area code': code, 'Area type': level,
+                                   'Cases': rng.integers(0, 500, len(dates)), 'Tests': rng.integers(0, 5000, len(dates)),
+                                   'Hospital Cases': rng.integers(0, 50, len(dates)), 'Deaths within 28 Days of Positive Test': rng.integers(0, 20, len(dates))})
+                     for level, name, code in areas]).set_index('Date').sort_index()
+weeklydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Date': date, 'Cases': int(rng.integers(0, 3000))}
+                         for level, name, code in areas for date in pd.date_range('2020-03-01', '2022-06-26', freq='7D')])
+summarydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for level, name, code in areas])
+
+cases = CasesData(batch=True)
+cases.snapshot = CasesSnapshot(cases, dailydf, weeklydf, summarydf, data_timestamp='2020-10-01 12:00:00')
+
+CHARTS = [
+    {'plotlevel': 'Region', 'plotareas': 'London', 'plotvars': 'Cases|Average', 'plottitle': 'Daily Cases:*', 'plotdays': 28, 'showtitle': True, 'periodicity': 'daily'},
+    {'plotlevel': 'Region', 'plotareas': 'London|East Midlands', 'plotvars': 'Average', 'plottitle': '7 Day Average', 'plotdays': 0, 'showtitle': True, 'periodicity': 'daily'},
+    {'plotlevel': 'Nation', 'plotareas': 'England', 'plotvars': 'Cases|Average|Tests:y2', 'plottitle': 'Cases:*', 'plotdays': 90, 'showtitle': True, 'periodicity': 'daily'},
+    {'plotlevel': 'Nation', 'plotareas': 'England', 'plotvars': 'Cases|Average', 'plottitle': '', 'plotdays': 0, 'showtitle': False, 'periodicity': 'daily'},
+    {'plotlevel': 'Region', 'plotareas': 'London', 'plotvars': 'Cases:bar', 'plottitle': 'Weekly Change in Cases - London', 'plotdays': 0, 'showtitle': True, 'periodicity': 'weekly'},
+]
+
+
+DATE_STRING = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+
+def normalise(value):
+    ''' Serialised figure json with date strings in one format, as plotly versions format them differently (newer plotly
+        versions also send numeric arrays base64 encoded, so those are decoded back to lists, with NaN as null) '''
+
+    if isinstance(value, dict):
+        if set(value) == {'dtype', 'bdata'}:
+            array = np.frombuffer(base64.b64decode(value['bdata']), dtype='<' + value['dtype'])
+            return [None if np.isnan(item) else item for item in array.tolist()]
+        return {key: normalise(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalise(item) for item in value]
+    if isinstance(value, str) and DATE_STRING.match(value):
+        return pd.Timestamp(value).isoformat()
+
+    return value
+
+
+def test_golden_figures():
+
+    # Figures built directly serialise the same as plotly's
+    for plotparams in CHARTS:
+        chart = Chart.__new__(Chart)
+        chart.plotparams = plotparams
+
+        built = json.dumps(chart.build_trend_figure(cases.snapshot), cls=PlotlyJSONEncoder)
+        reference = json.dumps(chart.create_trend_chart(cases.snapshot), cls=PlotlyJSONEncoder)
+
+        assert normalise(json.loads(built)) == normalise(json.loads(reference))
+
+
+def test_lttb():
+
+    x = np.arange(1000, dtype=float)
+    y = rng.normal(100, 10, 1000)
+    y[500] = 1000
+
+    keep = lttb(x, y, 100)
+
+    # Threshold points, in order, with the end points and the peak
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert (np.diff(keep) > 0).all()
+    assert 500 in keep
+
+    # Series no longer than the threshold are kept whole
+    assert (lttb(x[:100], y[:100], 100) == np.arange(100)).all()
+    assert (lttb(x[:50], y[:50], 100) == np.arange(50)).all()
+
+
+def test_downsample():
+
+    chart = Chart.__new__(Chart)
+    chart.plotparams = {'showtitle': True}
+    maxpoints = CHART_WIDTH // PIXELS_PER_POINT
+
+    x = pd.date_range('2020-03-01', periods=1000)
+    y = pd.Series(rng.normal(100, 10, 1000), index=x)
+
+    dx, dy = chart.downsample(x, y)
+    assert len(dx) == len(dy) == maxpoints
+    assert dx[0] == x[0] and dx[-1] == x[-1]
+
+    # Gaps (NaN runs) keep their first missing value, so the line still breaks there
+    y.iloc[300:320] = np.nan
+    y.iloc[700:705] = np.nan
+    dx, dy = chart.downsample(x, y)
+    assert x[300] in dx and x[700] in dx
+    assert np.isnan(dy[x[300]]) and np.isnan(dy[x[700]])
+    assert dx[0] == x[0] and dx[-1] == x[-1]
+
+    # Short series pass through unchanged
+    sx, sy = chart.downsample(x[:maxpoints], y.iloc[:maxpoints])
+    assert sx.equals(x[:maxpoints])
+    pd.testing.assert_series_equal(sy, y.iloc[:maxpoints])
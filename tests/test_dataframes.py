@@ -1,11 +1,13 @@
 import datetime
 import os, sys
+import types
+import pandas as pd
 
 testdir = os.path.dirname(__file__)
 srcdir = '../app/src'
 sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
 
-from dataframes import CasesData
+from dataframes import CasesData, CasesSnapshot, get_area_rows, read_mapped_frames, write_mapped_frames
 
 cases = CasesData()
 
@@ -32,3 +34,53 @@ def test_summarydf():
     assert len(cases.summarydf) > 470
 
 
+
+
+def test_mapped_frames(tmp_path):
+
+    dates = pd.date_range('2020-09-01', '2020-09-30')
+    areas = [('Region','London','E12000007'), ('Region','East Midlands','E12000004'), ('Nation','England','E92000001')]
+    dailydf = pd.concat([pd.DataFrame({'Date': dates, 'Area name': name, 'Area code': code, 'Area type': level, 'Cases': range(30)})
+                         for level, name, code in areas]).set_index('Date').sort_index()
+    weeklydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Date': date, 'Cases': 7}
+                             for level, name, code in areas for date in pd.date_range('2020-09-06', '2020-09-27', freq='7D')])
+    summarydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for level, name, code in areas])
+
+    write_mapped_frames(str(tmp_path), (dailydf, weeklydf, summarydf))
+    (mdailydf, mweeklydf, msummarydf), (daily_rows, weekly_rows) = read_mapped_frames(str(tmp_path))
+
+    # Same data, with text columns as categoricals whose codes (like the numbers) are used in place
+    pd.testing.assert_frame_equal(mdailydf.astype({'Area name': str, 'Area code': str, 'Area type': str}), dailydf, check_index_type=False, check_freq=False)
+    pd.testing.assert_frame_equal(msummarydf, summarydf)
+    assert not mdailydf['Area name'].values.codes.flags.writeable
+    assert not mdailydf['Cases'].values.flags.writeable
+
+    for rows, df in [(daily_rows, dailydf), (weekly_rows, weeklydf)]:
+        expected = get_area_rows(df)
+        assert rows.keys() == expected.keys()
+        assert all((rows[key] == expected[key]).all() for key in rows)
+
+
+def test_find_area():
+
+    # A point is in an area at every level - lower tier authorities come first, MSOAs only if no authority has data
+    areas = [('Region','London','E12000007'), ('Upper tier local authority','Ealing','E09000009'),
+             ('Lower tier local authority','Ealing','E09000009'), ('Middle layer super output area','Ealing 012','E02000383')]
+    dailydf = pd.DataFrame([{'Date': pd.Timestamp('2020-09-30'), 'Area name': name, 'Area code': code, 'Area type': level, 'Cases': 1}
+                            for level, name, code in areas]).set_index('Date')
+    weeklydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Date': pd.Timestamp('2020-09-27'), 'Cases': 7}
+                             for level, name, code in areas])
+    summarydf = pd.DataFrame([{'Area code': code, 'Area name': name, 'Area type': level, 'Population': 1000} for level, name, code in areas])
+
+    found = {level: code for level, name, code in areas}
+    locator = types.SimpleNamespace(locate=lambda lat, lon: found)
+    snapshot = CasesSnapshot(types.SimpleNamespace(levels=cases.levels, locator=locator), dailydf, weeklydf, summarydf)
+
+    assert snapshot.find_area(51.513, -0.304) == ('Lower tier local authority', 'Ealing')
+    assert snapshot.get_plot_level('Ealing') == 'Lower tier local authority'
+
+    del found['Lower tier local authority'], found['Upper tier local authority'], found['Region']
+    assert snapshot.find_area(51.513, -0.304) == ('Middle layer super output area', 'Ealing 012')
+
+    found.clear()
+    assert snapshot.find_area(51.513, -0.304) is None
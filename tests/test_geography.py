@@ -0,0 +1,57 @@
+import os, sys
+import json
+import pandas as pd
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from geography import build_adjacency, AreaGraph, AreaLocator, simplify_geojson, GEO_RESOLUTIONS
+
+with open(os.path.join(testdir, srcdir, 'data', 'uklocalauthgeo.json'), encoding='utf-8') as f:
+    geojson = json.load(f)
+
+graph = AreaGraph(build_adjacency(geojson, 'lad19cd'))
+locator = AreaLocator({'Lower tier local authority' : {'key' : 'lad19cd', 'data' : geojson}})
+
+
+def neighbours(code):
+    i = graph.codes.index(code)
+    return {graph.codes[j] for j in graph.neighbours[graph.offsets[i]:graph.offsets[i+1]]}
+
+
+def test_adjacency():
+
+    # Ealing borders Brent, Hammersmith & Fulham, Harrow, Hillingdon and Hounslow
+    assert neighbours('E09000009') == {'E09000005','E09000013','E09000015','E09000017','E09000018'}
+
+def test_adjacency_symmetric():
+
+    for code in graph.codes:
+        for neighbour in neighbours(code):
+            assert code in neighbours(neighbour)
+
+def test_clusters():
+
+    values = pd.Series(0, index=graph.codes)
+    values[['E09000009','E09000017','E09000015','E06000001']] = 1
+
+    # Isolated hot area (Hartlepool) is not a cluster
+    assert graph.find_clusters(values, 0.5) == [['E09000009','E09000015','E09000017']]
+
+def test_locate():
+
+    assert locator.locate(51.513, -0.304) == {'Lower tier local authority' : 'E09000009'}   # Ealing
+    assert locator.locate(52.95, -1.15) == {'Lower tier local authority' : 'E06000018'}     # Nottingham
+    assert locator.locate(50.0, -10.0) == {}
+
+def test_simplify():
+
+    simplified = simplify_geojson(geojson, 'lad19cd', GEO_RESOLUTIONS['high']['tolerance'], GEO_RESOLUTIONS['high']['precision'])
+    simplified_graph = AreaGraph(build_adjacency(simplified, 'lad19cd'))
+
+    # Fewer points, but shared borders are simplified identically so neighbours are unchanged
+    assert len(json.dumps(simplified)) < len(json.dumps(geojson)) / 2
+    assert simplified_graph.codes == graph.codes
+    assert list(simplified_graph.offsets) == list(graph.offsets)
+    assert list(simplified_graph.neighbours) == list(graph.neighbours)
@@ -0,0 +1,98 @@
+import os, sys
+import threading
+import time
+import redis
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from rendercache import RenderCache, ResponseCache, SingleFlight, render_key, FLIGHT_WAIT_SECONDS, RENDER_WAIT_SECONDS
+
+render_cache = RenderCache(redis.Redis(host="localhost", port=6379, db=0), ttl=60)
+
+
+def test_render_key():
+
+    # Same request with json keys in a different order shares a key, another generation doesn't
+    key = render_key('2020-10-01 12:00:00', '/_dash-update-component', '{"output": "map.figure", "inputs": [1]}')
+
+    assert key == render_key('2020-10-01 12:00:00', '/_dash-update-component', '{"inputs": [1], "output": "map.figure"}')
+    assert key != render_key('2020-10-02 12:00:00', '/_dash-update-component', '{"inputs": [1], "output": "map.figure"}')
+
+
+def test_response_cache():
+
+    response_cache = ResponseCache(2)
+    assert response_cache.get('a', 'gen1') is None
+
+    # Least recently used goes first when full
+    response_cache.put('a', 'gen1', b'a')
+    response_cache.put('b', 'gen1', b'b')
+    assert response_cache.get('a', 'gen1') == b'a'
+    response_cache.put('c', 'gen1', b'c')
+    assert response_cache.get('b', 'gen1') is None
+
+    # Values rendered for an old generation aren't kept, and a new generation empties the cache
+    response_cache.put('d', 'gen0', b'd')
+    assert response_cache.get('d', 'gen1') is None
+    assert response_cache.get('a', 'gen2') is None
+    assert response_cache.stats() == {'size': 0, 'hits': 1, 'misses': 4}
+
+
+def test_single_writer():
+
+    key = render_key('test', '/_dash-layout', '')
+    render_cache.redis.delete('Render.' + key, 'Render.Lock.' + key)
+
+    # First miss claims the render, nobody else can until it's stored
+    assert render_cache.get(key) is None
+    assert not render_cache.claim(key)
+
+    render_cache.put(key, b'{"layout": 1}')
+
+    assert render_cache.get(key) == b'{"layout": 1}'
+    assert render_cache.claim(key)
+    render_cache.release(key)
+
+
+def test_single_flight():
+
+    in_flight = SingleFlight()
+    results = []
+
+    def request():
+        if in_flight.join('key'):
+            time.sleep(0.2)
+            results.append('rendered')
+            in_flight.finish('key')
+        else:
+            results.append('waited')
+
+    threads = [threading.Thread(target=request) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == ['rendered'] + ['waited'] * 4
+    assert in_flight.stats() == {'in_flight': 0, 'renders': 1, 'coalesced': 4}
+
+
+def test_short_waits():
+
+    key = render_key('test', '/_dash-update-component', '{"slow": 1}')
+    render_cache.redis.delete('Render.' + key, 'Render.Lock.' + key)
+
+    # A render that never finishes (here or in another worker) only holds others up briefly
+    assert render_cache.claim(key)
+    started = time.time()
+    assert render_cache.get(key) is None
+    assert RENDER_WAIT_SECONDS <= time.time() - started < RENDER_WAIT_SECONDS + 0.5
+    render_cache.release(key)
+
+    in_flight = SingleFlight()
+    assert in_flight.join(key)
+    started = time.time()
+    assert not in_flight.join(key)
+    assert FLIGHT_WAIT_SECONDS <= time.time() - started < FLIGHT_WAIT_SECONDS + 0.5
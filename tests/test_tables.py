@@ -0,0 +1,69 @@
+import os, sys
+import types
+import pandas as pd
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tables import TableView
+
+# Made up summary for 60 regions - populations repeat every 10 areas, so sorts on them have ties
+
+summarydf = pd.DataFrame([{'Area code': 'E%08d' % i, 'Area name': 'Area %02d' % i, 'Area type': 'Region', 'Population': 1000 * (i % 10),
+                           'All Time Cases': 10 * i, 'Last 14 Days Trend Slope': round(0.1 * (i % 7) - 0.3, 2)} for i in range(60)])
+summarydf.loc[5, 'Area name'] = 'Greater London'
+
+view = TableView({'link': 'table3', 'plotlevel': 'Region', 'hyperlink': False}, types.SimpleNamespace(summarydf=summarydf))
+
+
+def names(records):
+
+    return [record['Area name'] for record in records]
+
+
+def test_filters():
+
+    # Numeric, text & contains clauses, alone and combined
+    records, pages = view.page(0, 100, filter_query='{Population} >= 8000')
+    assert sorted(record['Population'] for record in records) == [8000] * 6 + [9000] * 6
+    assert pages == 1
+
+    assert names(view.page(0, 100, filter_query='{All Time Cases} lt 30')[0]) == ['Area 00', 'Area 01', 'Area 02']
+    assert names(view.page(0, 100, filter_query='{Area name} = "Area 07"')[0]) == ['Area 07']
+    assert names(view.page(0, 100, filter_query='{Area name} contains lon')[0]) == ['Greater London']
+    assert names(view.page(0, 100, filter_query='{Area name} contains 4 && {Population} = 4000')[0]) == ['Area 04', 'Area 14', 'Area 24', 'Area 34', 'Area 44', 'Area 54']
+
+    # No filter is every row, an unparseable clause no rows
+    assert len(view.page(0, 100, filter_query='')[0]) == 60
+    for query in ['{Population} > lots', '{Nonexistent} > 1', 'Population > 1', '{Area name} contains 5 && {Population} ~ 1']:
+        assert view.page(0, 100, filter_query=query) == ([], 1)
+
+
+def test_sort():
+
+    # Ties on the first column are ordered by the second
+    records = view.page(0, 100, sort_by=[{'column_id': 'Population', 'direction': 'desc'}, {'column_id': 'All Time Cases', 'direction': 'asc'}])[0]
+    assert [(record['Population'], record['All Time Cases']) for record in records[:7]] == \
+        [(9000, 90), (9000, 190), (9000, 290), (9000, 390), (9000, 490), (9000, 590), (8000, 80)]
+
+    records = view.page(0, 100, sort_by=[{'column_id': 'Last 14 Days Trend Slope', 'direction': 'asc'}, {'column_id': 'Area name', 'direction': 'desc'}])[0]
+    assert names(records[:3]) == ['Area 56', 'Area 49', 'Area 42']
+    assert records[-1]['Last 14 Days Trend Slope'] == 0.3
+
+    # Sorting applies before filtering & paging
+    records = view.page(1, 2, sort_by=[{'column_id': 'All Time Cases', 'direction': 'desc'}], filter_query='{Population} = 1000')[0]
+    assert names(records) == ['Area 31', 'Area 21']
+
+
+def test_page_bounds():
+
+    # Default order (by area name), full pages then a partial last page, nothing past the end
+    records, pages = view.page(0)
+    assert pages == 3 and len(records) == 25 and records[0]['Area name'] == 'Area 00'
+
+    records, pages = view.page(2)
+    assert pages == 3 and len(records) == 10 and records[-1]['Area name'] == 'Greater London'
+
+    assert view.page(3) == ([], 3)
+    assert view.page(0, 100, filter_query='{Population} > 100000') == ([], 1)
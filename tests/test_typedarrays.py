@@ -0,0 +1,48 @@
+import os, sys
+import base64
+import datetime
+import numpy as np
+import pandas as pd
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from typedarrays import encode_array, encode_figure
+
+
+def decode(value):
+    ''' Decodes typed array json as assets/typedarrays.js does '''
+
+    array = np.frombuffer(base64.b64decode(value['bdata']), dtype='<' + value['dtype'])
+    if value.get('dates') == 'days':
+        return array.astype('datetime64[D]')
+    return array
+
+
+def test_numbers():
+
+    assert encode_array([1, 2, 3]) == {'dtype': 'i4', 'bdata': base64.b64encode(np.array([1, 2, 3], dtype='<i4').tobytes()).decode()}
+
+    values = np.array([1.5, np.nan, 3.25])
+    np.testing.assert_array_equal(decode(encode_array(pd.Series(values))), values)
+
+
+def test_dates():
+
+    dates = pd.date_range('2020-09-01', periods=3)
+    encoded = encode_array(dates.to_pydatetime())
+
+    assert encoded['dates'] == 'days'
+    assert list(decode(encoded)) == list(dates.values.astype('datetime64[D]'))
+
+
+def test_figure():
+
+    # Only numbers & dates are encoded, the figure passed in isn't changed
+    figure = {'data': [{'type': 'choroplethmapbox', 'locations': ['E1', 'E2'], 'z': np.array([0.5, 1.0]), 'text': ['A', 'B']}], 'layout': {}}
+    encoded = encode_figure(figure)
+
+    assert encoded['data'][0]['locations'] == ['E1', 'E2'] and encoded['data'][0]['text'] == ['A', 'B']
+    assert encoded['data'][0]['z']['dtype'] == 'f8'
+    assert isinstance(figure['data'][0]['z'], np.ndarray)
@@ -0,0 +1,69 @@
+import os, sys
+import json
+import types
+import redis
+
+testdir = os.path.dirname(__file__)
+srcdir = '../app/src'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from rendercache import render_key
+from warmer import CacheWarmer, WARM_REQUESTS_KEY, WARM_TRACKED_REQUESTS, is_recorded, page_request
+
+cases = types.SimpleNamespace(redis_connection=redis.Redis(host="localhost", port=6379, db=0))
+
+
+def callback_body(inputs):
+
+    return json.dumps({'output': 'map.figure', 'inputs': inputs})
+
+
+def test_is_recorded():
+
+    # Pages & callbacks are counted, but not location searches or panned / zoomed maps
+    assert is_recorded('/_dash-layout', '')
+    assert is_recorded(*page_request('/chart2/Region/London/Cases/Daily Cases/0'))
+    assert not is_recorded(*page_request('/find/51.5072/-0.1276'))
+    assert is_recorded('/_dash-update-component', callback_body([{'id': 'map', 'property': 'relayoutData', 'value': None}]))
+    assert not is_recorded('/_dash-update-component', callback_body([{'id': 'map', 'property': 'relayoutData', 'value': {'mapbox.zoom': 7.5}}]))
+
+
+def test_page_request():
+
+    # Warmed page requests share a render key with a browser's - browsers only percent-encode spaces here, not | : * ( )
+    links = {
+        '/chart2/Region/London|East Midlands|South East/Cases|Average/Daily Cases:*/28/':
+            '/chart2/Region/London|East%20Midlands|South%20East/Cases|Average/Daily%20Cases:*/28/',
+        '/table1/Lower tier local authority/Local Authorities with Increasing Fortnightly Cases (To Week Ending 4th Oct)':
+            '/table1/Lower%20tier%20local%20authority/Local%20Authorities%20with%20Increasing%20Fortnightly%20Cases%20(To%20Week%20Ending%204th%20Oct)'
+    }
+
+    for href, pathname in links.items():
+        browser = json.dumps({'output': '..page-content.children...intermediate-value.children..',
+                              'outputs': [{'id': 'page-content', 'property': 'children'}, {'id': 'intermediate-value', 'property': 'children'}],
+                              'inputs': [{'id': 'url', 'property': 'pathname', 'value': pathname}], 'changedPropIds': ['url.pathname']})
+        path, body = page_request(href)
+
+        assert render_key('gen', path, body) == render_key('gen', '/_dash-update-component', browser)
+
+
+def test_record_flush():
+
+    cases.redis_connection.delete(WARM_REQUESTS_KEY)
+    warmer = CacheWarmer(None, cases, [])
+
+    # Counted in memory until flushed, and no more than the tracked number of distinct requests
+    for i in range(WARM_TRACKED_REQUESTS + 10):
+        warmer.record(*page_request('/chart2/Region/Area ' + str(i) + '/Cases/Daily Cases/0'))
+    warmer.record(*page_request('/chart2/Region/Area 0/Cases/Daily Cases/0'))
+
+    assert not cases.redis_connection.exists(WARM_REQUESTS_KEY)
+    assert len(warmer.counts) == WARM_TRACKED_REQUESTS
+
+    warmer.flush()
+    request = json.dumps(dict(zip(['path', 'body'], page_request('/chart2/Region/Area 0/Cases/Daily Cases/0'))))
+
+    assert cases.redis_connection.zscore(WARM_REQUESTS_KEY, request) == 2
+    assert len(cases.redis_connection.zrevrange(WARM_REQUESTS_KEY, 0, -1)) == WARM_TRACKED_REQUESTS
+    assert cases.redis_connection.ttl(WARM_REQUESTS_KEY) > 0
+    assert not warmer.counts